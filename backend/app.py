@@ -1,5 +1,7 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
 import json
 import os
 from ml_pipeline import MLPipeline
@@ -14,35 +16,56 @@ ml_pipeline = MLPipeline()
 
 global_logger.info("Flask backend started successfully")
 
+HEALTH_STATUS = {
+    'status': 'online',
+    'message': 'Backend server is running',
+    'version': '1.0.0'
+}
+
+DATASETS = [
+    {
+        'id': 'imdb',
+        'name': 'IMDb Movie Reviews',
+        'description': 'Binary sentiment classification (positive/negative)',
+        'samples': 2000
+    },
+    {
+        'id': 'news',
+        'name': 'News Category Dataset',
+        'description': 'Multi-class news article classification',
+        'samples': 2000
+    }
+]
+
+MODELS = [
+    {
+        'id': 'logistic',
+        'name': 'Logistic Regression',
+        'description': 'Fast linear classifier'
+    },
+    {
+        'id': 'naive_bayes',
+        'name': 'Naive Bayes',
+        'description': 'Probabilistic classifier'
+    },
+    {
+        'id': 'svm',
+        'name': 'Support Vector Machine',
+        'description': 'Powerful kernel-based classifier'
+    }
+]
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
-        'status': 'online',
-        'message': 'Backend server is running',
-        'version': '1.0.0'
-    })
+    return jsonify(HEALTH_STATUS)
 
 @app.route('/api/datasets', methods=['GET'])
 def get_datasets():
     """Return available datasets"""
     try:
         global_logger.info("Fetching available datasets")
-        datasets = [
-            {
-                'id': 'imdb',
-                'name': 'IMDb Movie Reviews',
-                'description': 'Binary sentiment classification (positive/negative)',
-                'samples': 2000
-            },
-            {
-                'id': 'news',
-                'name': 'News Category Dataset',
-                'description': 'Multi-class news article classification',
-                'samples': 2000
-            }
-        ]
-        return jsonify(datasets)
+        return jsonify(DATASETS)
     except Exception as e:
         global_logger.error("Failed to fetch datasets", e)
         return jsonify({'error': 'Failed to fetch datasets'}), 500
@@ -52,37 +75,102 @@ def get_models():
     """Return available models"""
     try:
         global_logger.info("Fetching available models")
-        models = [
-            {
-                'id': 'logistic',
-                'name': 'Logistic Regression',
-                'description': 'Fast linear classifier'
-            },
-            {
-                'id': 'naive_bayes',
-                'name': 'Naive Bayes',
-                'description': 'Probabilistic classifier'
-            },
-            {
-                'id': 'svm',
-                'name': 'Support Vector Machine',
-                'description': 'Powerful kernel-based classifier'
-            }
-        ]
-        return jsonify(models)
+        return jsonify(MODELS)
     except Exception as e:
         global_logger.error("Failed to fetch models", e)
         return jsonify({'error': 'Failed to fetch models'}), 500
 
+def resolve_stream_format(stream, accept, default=None):
+    """Pick a streaming format from the body's stream flag or the Accept header's preferred type"""
+    best = parse_accept_header(accept, MIMEAccept).best
+    if stream == 'sse' or best == 'text/event-stream':
+        return 'sse'
+    if stream in (True, 'ndjson') or best == 'application/x-ndjson':
+        return 'ndjson'
+    return default
+
+def get_stream_format(data, default=None):
+    """Pick a streaming format for the current Flask request"""
+    return resolve_stream_format(data.get('stream'), request.headers.get('Accept', ''), default)
+
+STREAM_MIMETYPES = {
+    'sse': 'text/event-stream',
+    'ndjson': 'application/x-ndjson'
+}
+
+# Keep reverse proxies from buffering the stream
+STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+def format_event(event, payload, stream_format):
+    """Serialize one (event, payload) pair as an NDJSON line or server-sent event"""
+    if stream_format == 'sse':
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps(payload) + '\n'
+
+def stream_response(events, stream_format):
+    """Stream (event, payload) pairs as NDJSON lines or server-sent events"""
+    def generate():
+        for event, payload in events:
+            yield format_event(event, payload, stream_format)
+
+    return Response(stream_with_context(generate()), mimetype=STREAM_MIMETYPES[stream_format],
+                    headers=STREAM_HEADERS)
+
+def read_json_object():
+    """Parse the request body as a JSON object; an empty body means no parameters"""
+    if not request.get_data():
+        return {}
+    data = request.get_json(silent=True, force=True)
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+def validate_prefix_length(value):
+    """Prefix lengths are non-negative integers; 0 means the full text"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        raise ValueError(f"prefix length must be a non-negative integer, got {value!r}")
+    return value
+
+def save_experiment(dataset_id, model_id, prefix_length, results):
+    """Base64-encode result plots in place and persist the experiment"""
+    # Convert plot images to base64
+    plots_data = {}
+    if 'plots' in results:
+        for key, fig_bytes in results['plots'].items():
+            plots_data[key] = base64.b64encode(fig_bytes).decode('utf-8')
+            results['plots'][key] = plots_data[key]
+
+    # Save experiment to database
+    experiment_data = {
+        'dataset_id': dataset_id,
+        'model_id': model_id,
+        'prefix_length': prefix_length,
+        'full_text_metrics': results['full_text'],
+        'prefix_metrics': results['prefix'],
+        'performance_retention': results['performance_retention'],
+        'dataset_size': results['dataset_size'],
+        'train_size': results['train_size'],
+        'test_size': results['test_size'],
+        'label_names': results['label_names'],
+        'plots': plots_data
+    }
+    global_logger.log_experiment(experiment_data)
+
 @app.route('/api/experiment', methods=['POST'])
 def run_experiment():
     """Run ML experiment with given parameters"""
     try:
-        data = request.json
-        dataset_id = data.get('dataset', 'imdb')
-        model_id = data.get('model', 'logistic')
-        prefix_length = data.get('prefixLength', 50)
+        data = read_json_object()
+        prefix_length = validate_prefix_length(data.get('prefixLength', 50))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    dataset_id = data.get('dataset', 'imdb')
+    model_id = data.get('model', 'logistic')
 
+    try:
         global_logger.info(f"Starting experiment: dataset={dataset_id}, model={model_id}, prefix_length={prefix_length}")
 
         # Run experiment
@@ -92,28 +180,7 @@ def run_experiment():
             prefix_length=prefix_length
         )
 
-        # Convert plot images to base64
-        plots_data = {}
-        if 'plots' in results:
-            for key, fig_bytes in results['plots'].items():
-                plots_data[key] = base64.b64encode(fig_bytes).decode('utf-8')
-                results['plots'][key] = plots_data[key]
-
-        # Save experiment to database
-        experiment_data = {
-            'dataset_id': dataset_id,
-            'model_id': model_id,
-            'prefix_length': prefix_length,
-            'full_text_metrics': results['full_text'],
-            'prefix_metrics': results['prefix'],
-            'performance_retention': results['performance_retention'],
-            'dataset_size': results['dataset_size'],
-            'train_size': results['train_size'],
-            'test_size': results['test_size'],
-            'label_names': results['label_names'],
-            'plots': plots_data
-        }
-        global_logger.log_experiment(experiment_data)
+        save_experiment(dataset_id, model_id, prefix_length, results)
 
         global_logger.info(f"Experiment completed successfully: accuracy={results['prefix']['accuracy']:.3f}")
 
@@ -121,22 +188,137 @@ def run_experiment():
 
     except Exception as e:
         global_logger.error("Experiment failed", e, {
-            'dataset_id': data.get('dataset') if 'data' in locals() else None,
-            'model_id': data.get('model') if 'data' in locals() else None,
-            'prefix_length': data.get('prefixLength') if 'data' in locals() else None
+            'dataset_id': dataset_id,
+            'model_id': model_id,
+            'prefix_length': prefix_length
         })
         return jsonify({'error': str(e)}), 500
 
+# Largest grid (datasets x models x prefix lengths) one batch request may run
+MAX_BATCH_CELLS = 60
+
+def parse_batch_list(data, plural, singular, default):
+    """Read a list field, falling back to a one-item list from its singular form"""
+    values = data.get(plural)
+    if values is None:
+        values = [data.get(singular, default)]
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"{plural} must be a non-empty list")
+    return values
+
+def parse_batch_request(data):
+    """Read and validate the (datasets, models, prefix lengths) grid from a batch request body"""
+    dataset_ids = parse_batch_list(data, 'datasets', 'dataset', 'imdb')
+    model_ids = parse_batch_list(data, 'models', 'model', 'logistic')
+    prefix_lengths = parse_batch_list(data, 'prefixLengths', 'prefixLength', 50)
+
+    known_datasets = {dataset['id'] for dataset in DATASETS}
+    known_models = {model['id'] for model in MODELS}
+    for dataset_id in dataset_ids:
+        if dataset_id not in known_datasets:
+            raise ValueError(f"Unknown dataset: {dataset_id!r}")
+    for model_id in model_ids:
+        if model_id not in known_models:
+            raise ValueError(f"Unknown model: {model_id!r}")
+    for prefix_length in prefix_lengths:
+        validate_prefix_length(prefix_length)
+
+    # The pipeline runs each distinct cell once
+    cells = len(set(dataset_ids)) * len(set(model_ids)) * len(set(prefix_lengths))
+    if cells > MAX_BATCH_CELLS:
+        raise ValueError(f"Batch has {cells} cells; at most {MAX_BATCH_CELLS} are allowed")
+    return dataset_ids, model_ids, prefix_lengths
+
+def experiment_batch_events(dataset_ids, model_ids, prefix_lengths):
+    """Yield one event per finished grid cell, then a summary"""
+    completed = 0
+    try:
+        for results in ml_pipeline.run_experiment_batch(dataset_ids, model_ids, prefix_lengths):
+            save_experiment(results['dataset'], results['model'], results['prefix_length'], results)
+            completed += 1
+            yield 'result', results
+        global_logger.info(f"Experiment batch completed successfully: cells={completed}")
+        yield 'summary', {'done': True, 'completed': completed}
+    except Exception as e:
+        global_logger.error("Experiment batch failed", e, {
+            'dataset_ids': dataset_ids,
+            'model_ids': model_ids,
+            'prefix_lengths': prefix_lengths
+        })
+        yield 'error', {'error': str(e), 'completed': completed}
+
+@app.route('/api/experiment/batch', methods=['POST'])
+def run_experiment_batch():
+    """Run a grid of experiments, streaming one result per finished cell"""
+    details = {}
+    try:
+        data = read_json_object()
+        dataset_ids, model_ids, prefix_lengths = parse_batch_request(data)
+        details = {
+            'dataset_ids': dataset_ids,
+            'model_ids': model_ids,
+            'prefix_lengths': prefix_lengths
+        }
+
+        global_logger.info(
+            f"Starting experiment batch: datasets={dataset_ids}, models={model_ids}, prefix_lengths={prefix_lengths}"
+        )
+
+        return stream_response(
+            experiment_batch_events(dataset_ids, model_ids, prefix_lengths),
+            get_stream_format(data, default='ndjson')
+        )
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        global_logger.error("Experiment batch failed", e, details)
+        return jsonify({'error': str(e)}), 500
+
+def token_comparison_events(dataset_id, model_id):
+    """Yield one event per completed token count, then the summary with the plot"""
+    token_counts = []
+    accuracies = []
+    memory = ml_pipeline.track_memory()
+    try:
+        for step in ml_pipeline.iter_token_counts(dataset_id, model_id, memory):
+            token_counts.append(step['token_count'])
+            accuracies.append(step['accuracy'])
+            yield 'progress', step
+
+        with memory.stage('plots'):
+            plot = ml_pipeline.create_token_count_plot(accuracies)
+        global_logger.info("Token comparison completed successfully")
+        yield 'summary', {
+            'token_counts': token_counts,
+            'accuracies': accuracies,
+            'plot': base64.b64encode(plot).decode('utf-8'),
+            'memory': memory.report()
+        }
+    except Exception as e:
+        global_logger.error("Token comparison failed", e, {
+            'dataset_id': dataset_id,
+            'model_id': model_id
+        })
+        yield 'error', {'error': str(e)}
+
 @app.route('/api/token-comparison', methods=['POST'])
 def token_comparison():
     """Compare accuracy across different token counts"""
     try:
-        data = request.json
-        dataset_id = data.get('dataset', 'imdb')
-        model_id = data.get('model', 'logistic')
+        data = read_json_object()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    dataset_id = data.get('dataset', 'imdb')
+    model_id = data.get('model', 'logistic')
 
+    try:
         global_logger.info(f"Starting token comparison: dataset={dataset_id}, model={model_id}")
 
+        stream_format = get_stream_format(data)
+        if stream_format:
+            return stream_response(token_comparison_events(dataset_id, model_id), stream_format)
+
         results = ml_pipeline.compare_token_counts(
             dataset_id=dataset_id,
             model_id=model_id
@@ -152,10 +334,92 @@ def token_comparison():
 
     except Exception as e:
         global_logger.error("Token comparison failed", e, {
-            'dataset_id': data.get('dataset') if 'data' in locals() else None,
-            'model_id': data.get('model') if 'data' in locals() else None
+            'dataset_id': dataset_id,
+            'model_id': model_id
         })
         return jsonify({'error': str(e)}), 500
 
+MAX_HISTORY_LIMIT = 500
+
+def parse_history_filters(args):
+    """Read experiment history filters from query parameters"""
+    prefix_length = args.get('prefixLength')
+    return {
+        'dataset_id': args.get('dataset'),
+        'model_id': args.get('model'),
+        'prefix_length': int(prefix_length) if prefix_length is not None else None,
+        'since': args.get('since'),
+        'until': args.get('until')
+    }
+
+def parse_list_arg(args, name):
+    value = args.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+def history_unavailable():
+    return jsonify({'error': 'Experiment history is not configured'}), 503
+
+@app.route('/api/experiments', methods=['GET'])
+def list_experiments():
+    """Page through experiment history, newest first, without plots or per-sample arrays by default"""
+    store = global_logger.experiment_store
+    if store is None:
+        return history_unavailable()
+    try:
+        include = parse_list_arg(request.args, 'include') or []
+        limit = int(request.args.get('limit', 50))
+        if not 1 <= limit <= MAX_HISTORY_LIMIT:
+            raise ValueError(f"limit must be between 1 and {MAX_HISTORY_LIMIT}")
+        experiments, next_cursor = store.query(
+            filters=parse_history_filters(request.args),
+            fields=parse_list_arg(request.args, 'fields'),
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            include_arrays='arrays' in include,
+            include_plots='plots' in include
+        )
+        return jsonify({'experiments': experiments, 'next_cursor': next_cursor})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        global_logger.error("Failed to query experiments", e)
+        return jsonify({'error': 'Failed to query experiments'}), 500
+
+@app.route('/api/experiments/summary', methods=['GET'])
+def summarize_experiments():
+    """Aggregate a metric over experiment history, grouped by model and prefix length by default"""
+    store = global_logger.experiment_store
+    if store is None:
+        return history_unavailable()
+    try:
+        group_by = parse_list_arg(request.args, 'groupBy') or ['model_id', 'prefix_length']
+        metric = request.args.get('metric', 'performance_retention')
+        groups = store.aggregate(
+            group_by=group_by,
+            metric=metric,
+            filters=parse_history_filters(request.args)
+        )
+        return jsonify({'group_by': group_by, 'metric': metric, 'groups': groups})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        global_logger.error("Failed to summarize experiments", e)
+        return jsonify({'error': 'Failed to summarize experiments'}), 500
+
+@app.route('/api/experiments/<experiment_id>', methods=['GET'])
+def get_experiment(experiment_id):
+    """Return one experiment including its plots and per-sample arrays"""
+    store = global_logger.experiment_store
+    if store is None:
+        return history_unavailable()
+    try:
+        experiment = store.get(experiment_id)
+        if experiment is None:
+            return jsonify({'error': 'Experiment not found'}), 404
+        return jsonify(experiment)
+    except Exception as e:
+        global_logger.error("Failed to fetch experiment", e, {'experiment_id': experiment_id})
+        return jsonify({'error': 'Failed to fetch experiment'}), 500
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
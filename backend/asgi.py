@@ -0,0 +1,330 @@
+"""Async serving layer for production deployments.
+
+Cheap endpoints (health, datasets, models) are answered directly on the event
+loop. Training endpoints are offloaded to a bounded process pool; once every
+worker is busy and the queue is full, new training requests get a 429 instead
+of piling up. Any route not defined here falls through to the Flask app, so
+request and response contracts are identical to `python app.py`.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Pool size is configured through ML_WORKERS (default: CPU count) and
+ML_QUEUE_DEPTH (jobs allowed to wait for a worker, default: ML_WORKERS).
+"""
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from queue import Empty
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flask_backend
+import workers
+from logger import global_logger
+
+ML_WORKERS = int(os.environ.get('ML_WORKERS', os.cpu_count() or 1))
+ML_QUEUE_DEPTH = int(os.environ.get('ML_QUEUE_DEPTH', ML_WORKERS))
+
+class TrainingPool:
+    """Process pool that admits at most workers + queue_depth jobs at a time"""
+
+    def __init__(self, max_workers, queue_depth):
+        self.max_workers = max_workers
+        self.capacity = max_workers + queue_depth
+        self.in_flight = 0
+        self.executor = None
+        self.manager = None
+
+    def start(self):
+        # Spawn rather than fork: the server process holds threads and an event loop
+        context = multiprocessing.get_context('spawn')
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=workers.init_worker
+        )
+        self.manager = context.Manager()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
+
+    def submit(self, fn, *args):
+        """Schedule fn on the pool, or return None when the pool is saturated"""
+        if self.in_flight >= self.capacity:
+            return None
+        self.in_flight += 1
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future):
+        self.in_flight -= 1
+
+    def submit_stream(self, fn, *args):
+        """Schedule a streaming job; returns (future, queue) or None when saturated"""
+        if self.in_flight >= self.capacity:
+            return None
+        queue = self.manager.Queue()
+        return self.submit(fn, queue, *args), queue
+
+    async def iter_events(self, future, queue):
+        """Relay (event, payload) pairs from a streaming job until it signals completion"""
+        while True:
+            try:
+                item = await run_in_threadpool(queue.get, True, 0.5)
+            except Empty:
+                if future.done():
+                    # Surface a crashed worker instead of waiting forever
+                    future.result()
+                    return
+                continue
+            if item is None:
+                return
+            yield item
+
+training_pool = TrainingPool(ML_WORKERS, ML_QUEUE_DEPTH)
+
+async def log_info(message):
+    # The logger writes to Supabase synchronously; keep that off the event loop
+    await run_in_threadpool(global_logger.info, message)
+
+async def log_error(message, exception=None, details=None):
+    await run_in_threadpool(global_logger.error, message, exception, details)
+
+def busy_response():
+    return JSONResponse(
+        {'error': 'Server is busy, please retry shortly'},
+        status_code=429,
+        headers={'Retry-After': '1'}
+    )
+
+async def read_json(request):
+    """Parse the body as a JSON object; an empty body means no parameters"""
+    body = await request.body()
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+async def health_check(request):
+    """Health check endpoint"""
+    return JSONResponse(flask_backend.HEALTH_STATUS)
+
+async def get_datasets(request):
+    """Return available datasets"""
+    await log_info("Fetching available datasets")
+    return JSONResponse(flask_backend.DATASETS)
+
+async def get_models(request):
+    """Return available models"""
+    await log_info("Fetching available models")
+    return JSONResponse(flask_backend.MODELS)
+
+async def run_experiment(request):
+    """Run ML experiment in the training pool"""
+    try:
+        data = await read_json(request)
+        prefix_length = flask_backend.validate_prefix_length(data.get('prefixLength', 50))
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    dataset_id = data.get('dataset', 'imdb')
+    model_id = data.get('model', 'logistic')
+
+    try:
+        future = training_pool.submit(workers.run_experiment, dataset_id, model_id, prefix_length)
+        if future is None:
+            return busy_response()
+
+        await log_info(f"Starting experiment: dataset={dataset_id}, model={model_id}, prefix_length={prefix_length}")
+        results = await future
+
+        await run_in_threadpool(flask_backend.save_experiment, dataset_id, model_id, prefix_length, results)
+
+        await log_info(f"Experiment completed successfully: accuracy={results['prefix']['accuracy']:.3f}")
+
+        return JSONResponse(results)
+
+    except Exception as e:
+        await log_error("Experiment failed", e, {
+            'dataset_id': dataset_id,
+            'model_id': model_id,
+            'prefix_length': prefix_length
+        })
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+def stream_events(events, stream_format):
+    async def generate():
+        async for event, payload in events:
+            yield flask_backend.format_event(event, payload, stream_format)
+
+    return StreamingResponse(
+        generate(),
+        media_type=flask_backend.STREAM_MIMETYPES[stream_format],
+        headers=flask_backend.STREAM_HEADERS
+    )
+
+async def token_comparison_events(future, queue, dataset_id, model_id):
+    """Encode the worker's plot and log the outcome while relaying its events"""
+    details = {'dataset_id': dataset_id, 'model_id': model_id}
+    try:
+        async for event, payload in training_pool.iter_events(future, queue):
+            if event == 'summary':
+                payload['plot'] = base64.b64encode(payload['plot']).decode('utf-8')
+                await log_info("Token comparison completed successfully")
+            elif event == 'error':
+                await log_error("Token comparison failed", None, {**details, **payload})
+                payload = {'error': payload['error']}
+            yield event, payload
+    except Exception as e:
+        await log_error("Token comparison failed", e, details)
+        yield 'error', {'error': str(e)}
+
+async def token_comparison(request):
+    """Compare accuracy across different token counts in the training pool"""
+    try:
+        data = await read_json(request)
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    dataset_id = data.get('dataset', 'imdb')
+    model_id = data.get('model', 'logistic')
+
+    try:
+        stream_format = flask_backend.resolve_stream_format(
+            data.get('stream'), request.headers.get('accept', '')
+        )
+        if stream_format:
+            submitted = training_pool.submit_stream(workers.stream_token_counts, dataset_id, model_id)
+            if submitted is None:
+                return busy_response()
+            await log_info(f"Starting token comparison: dataset={dataset_id}, model={model_id}")
+            future, queue = submitted
+            return stream_events(
+                token_comparison_events(future, queue, dataset_id, model_id), stream_format
+            )
+
+        future = training_pool.submit(workers.compare_token_counts, dataset_id, model_id)
+        if future is None:
+            return busy_response()
+
+        await log_info(f"Starting token comparison: dataset={dataset_id}, model={model_id}")
+        results = await future
+
+        # Convert plot to base64
+        if 'plot' in results:
+            results['plot'] = base64.b64encode(results['plot']).decode('utf-8')
+
+        await log_info("Token comparison completed successfully")
+
+        return JSONResponse(results)
+
+    except Exception as e:
+        await log_error("Token comparison failed", e, {
+            'dataset_id': dataset_id,
+            'model_id': model_id
+        })
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def experiment_batch_events(future, queue, dataset_ids, model_ids, prefix_lengths):
+    """Persist each finished cell and log the outcome while relaying the worker's events"""
+    details = {
+        'dataset_ids': dataset_ids,
+        'model_ids': model_ids,
+        'prefix_lengths': prefix_lengths
+    }
+    completed = 0
+    try:
+        async for event, payload in training_pool.iter_events(future, queue):
+            if event == 'error':
+                await log_error("Experiment batch failed", None, {**details, **payload})
+                yield 'error', {'error': payload['error'], 'completed': completed}
+                return
+            await run_in_threadpool(
+                flask_backend.save_experiment,
+                payload['dataset'], payload['model'], payload['prefix_length'], payload
+            )
+            completed += 1
+            yield event, payload
+    except Exception as e:
+        await log_error("Experiment batch failed", e, details)
+        yield 'error', {'error': str(e), 'completed': completed}
+        return
+
+    await log_info(f"Experiment batch completed successfully: cells={completed}")
+    yield 'summary', {'done': True, 'completed': completed}
+
+async def run_experiment_batch(request):
+    """Run a grid of experiments in the training pool, streaming one result per finished cell"""
+    details = {}
+    try:
+        data = await read_json(request)
+        dataset_ids, model_ids, prefix_lengths = flask_backend.parse_batch_request(data)
+        details = {
+            'dataset_ids': dataset_ids,
+            'model_ids': model_ids,
+            'prefix_lengths': prefix_lengths
+        }
+
+        submitted = training_pool.submit_stream(
+            workers.stream_experiment_batch, dataset_ids, model_ids, prefix_lengths
+        )
+        if submitted is None:
+            return busy_response()
+
+        await log_info(
+            f"Starting experiment batch: datasets={dataset_ids}, models={model_ids}, prefix_lengths={prefix_lengths}"
+        )
+
+        future, queue = submitted
+        stream_format = flask_backend.resolve_stream_format(
+            data.get('stream'), request.headers.get('accept', ''), default='ndjson'
+        )
+        return stream_events(
+            experiment_batch_events(future, queue, dataset_ids, model_ids, prefix_lengths),
+            stream_format
+        )
+
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+    except Exception as e:
+        await log_error("Experiment batch failed", e, details)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+@asynccontextmanager
+async def lifespan(app):
+    training_pool.start()
+    await log_info(f"ASGI backend started: workers={ML_WORKERS}, queue_depth={ML_QUEUE_DEPTH}")
+    yield
+    training_pool.shutdown()
+
+app = Starlette(
+    routes=[
+        Route('/api/health', health_check, methods=['GET']),
+        Route('/api/datasets', get_datasets, methods=['GET']),
+        Route('/api/models', get_models, methods=['GET']),
+        Route('/api/experiment', run_experiment, methods=['POST']),
+        Route('/api/experiment/batch', run_experiment_batch, methods=['POST']),
+        Route('/api/token-comparison', token_comparison, methods=['POST']),
+        Mount('/', app=WSGIMiddleware(flask_backend.app))
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ],
+    lifespan=lifespan
+)
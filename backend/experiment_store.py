@@ -0,0 +1,632 @@
+import base64
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Per-sample arrays moved out of the metrics JSON into the compressed blob
+ARRAY_FIELDS = ('predictions', 'true_labels')
+METRIC_SECTIONS = ('full_text_metrics', 'prefix_metrics')
+
+# Columns returned by default; plots and per-sample arrays are opt-in
+SUMMARY_COLUMNS = [
+    'id', 'created_at', 'dataset_id', 'model_id', 'prefix_length',
+    'performance_retention', 'full_accuracy', 'prefix_accuracy',
+    'dataset_size', 'train_size', 'test_size', 'label_names',
+    'full_text_metrics', 'prefix_metrics'
+]
+
+# Columns that can be filtered on and grouped by
+FILTER_COLUMNS = ('dataset_id', 'model_id', 'prefix_length')
+
+# Numeric columns that can be aggregated
+AGGREGATE_METRICS = ('performance_retention', 'full_accuracy', 'prefix_accuracy')
+
+# Scalar metrics kept in the metrics JSON (everything but the per-sample arrays)
+METRIC_KEYS = ('accuracy', 'precision', 'recall', 'f1_score', 'confusion_matrix')
+
+def validate_fields(fields):
+    unknown = [field for field in fields if field not in SUMMARY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+
+def validate_aggregate(group_by, metric):
+    unknown = [column for column in group_by if column not in FILTER_COLUMNS]
+    if unknown or not group_by:
+        raise ValueError(f"groupBy must be a non-empty subset of: {', '.join(FILTER_COLUMNS)}")
+    if metric not in AGGREGATE_METRICS:
+        raise ValueError(f"metric must be one of: {', '.join(AGGREGATE_METRICS)}")
+
+def validate_limit(limit):
+    if int(limit) < 1:
+        raise ValueError("limit must be a positive integer")
+
+def encode_cursor(record):
+    """Opaque keyset cursor pointing just past the given record"""
+    key = json.dumps([record['created_at'], record['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(key).decode('ascii')
+
+def decode_cursor(cursor):
+    try:
+        created_at, experiment_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return created_at, experiment_id
+
+def aggregate_rows(rows, group_by, metric):
+    """Group rows in Python; used where the backend cannot aggregate itself"""
+    groups = {}
+    for row in rows:
+        value = row.get(metric)
+        if value is None:
+            continue
+        key = tuple(row[column] for column in group_by)
+        group = groups.setdefault(key, {'count': 0, 'total': 0.0, 'min': value, 'max': value})
+        group['count'] += 1
+        group['total'] += float(value)
+        group['min'] = min(group['min'], value)
+        group['max'] = max(group['max'], value)
+    return [
+        {
+            **dict(zip(group_by, key)),
+            'count': group['count'],
+            'mean': group['total'] / group['count'],
+            'min': float(group['min']),
+            'max': float(group['max'])
+        }
+        for key, group in sorted(groups.items())
+    ]
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%f+00:00'
+
+def utc_now():
+    """Fixed-width ISO timestamp so text ordering matches time ordering"""
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def normalize_timestamp(value, name='timestamp'):
+    """Parse an ISO 8601 timestamp into utc_now's format; naive values are taken as UTC"""
+    try:
+        text = str(value)
+        if text.endswith(('Z', 'z')):
+            text = text[:-1] + '+00:00'
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp, got {value!r}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def time_range(filters):
+    """Normalized (since, until) bounds from history filters"""
+    return tuple(
+        normalize_timestamp(filters[bound], bound) if filters.get(bound) is not None else None
+        for bound in ('since', 'until')
+    )
+
+def pack_buffers(arrays, level=6):
+    """Pack named numpy arrays into one zlib blob: length-prefixed JSON header, then raw bytes"""
+    header = {name: [array.dtype.str, int(array.size)] for name, array in arrays.items()}
+    header_bytes = json.dumps(header).encode('utf-8')
+    payload = b''.join(array.tobytes() for array in arrays.values())
+    return zlib.compress(len(header_bytes).to_bytes(4, 'little') + header_bytes + payload, level)
+
+def unpack_buffers(blob):
+    data = zlib.decompress(blob)
+    header_size = int.from_bytes(data[:4], 'little')
+    header = json.loads(data[4:4 + header_size])
+    offset = 4 + header_size
+    arrays = {}
+    for name, (dtype, size) in header.items():
+        array = np.frombuffer(data, dtype=dtype, count=size, offset=offset)
+        arrays[name] = array
+        offset += array.nbytes
+    return arrays
+
+def pack_arrays(experiment_data):
+    """Compress the per-sample prediction arrays of both metric sections into one blob"""
+    arrays = {}
+    for section in METRIC_SECTIONS:
+        metrics = experiment_data.get(section) or {}
+        for field in ARRAY_FIELDS:
+            if field in metrics:
+                array = np.asarray(metrics[field])
+                if array.dtype.kind in 'iu' and array.size:
+                    # Labels are small class indices; store them in the narrowest integer type
+                    array = array.astype(np.promote_types(
+                        np.min_scalar_type(array.min()), np.min_scalar_type(array.max())
+                    ))
+                arrays[f'{section}.{field}'] = array
+    return pack_buffers(arrays) if arrays else None
+
+def unpack_arrays(blob):
+    if not blob:
+        return {}
+    return {name: array.tolist() for name, array in unpack_buffers(blob).items()}
+
+def pack_plots(plots):
+    """Store plots as raw PNG bytes instead of base64 text"""
+    if not plots:
+        return None
+    arrays = {
+        key: np.frombuffer(base64.b64decode(value), dtype=np.uint8)
+        for key, value in plots.items()
+    }
+    # PNG data is already deflated, so only do a fast pass
+    return pack_buffers(arrays, level=1)
+
+def unpack_plots(blob):
+    if not blob:
+        return {}
+    return {
+        key: base64.b64encode(array.tobytes()).decode('utf-8')
+        for key, array in unpack_buffers(blob).items()
+    }
+
+def strip_arrays(metrics):
+    return {key: value for key, value in (metrics or {}).items() if key not in ARRAY_FIELDS}
+
+def to_bytea(blob):
+    """Encode a blob as a Postgres bytea hex literal for PostgREST"""
+    return '\\x' + blob.hex() if blob is not None else None
+
+def from_bytea(value):
+    return bytes.fromhex(value[2:]) if value else None
+
+class ExperimentStore:
+    """Interface for experiment persistence backends.
+
+    `filters` may contain dataset_id, model_id and prefix_length (exact
+    matches) and since/until (created_at range, until exclusive).
+    """
+
+    def save(self, experiment_data):
+        self.save_many([experiment_data])
+
+    def save_many(self, experiments):
+        raise NotImplementedError
+
+    def query(self, filters=None, fields=None, limit=100, cursor=None,
+              include_arrays=False, include_plots=False):
+        """Return (records, next_cursor), newest first, paginated by (created_at, id)"""
+        raise NotImplementedError
+
+    def get(self, experiment_id, include_arrays=True, include_plots=True):
+        raise NotImplementedError
+
+    def aggregate(self, group_by=('model_id', 'prefix_length'), metric='performance_retention',
+                  filters=None):
+        """Return count/mean/min/max of `metric` per group"""
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+class SQLiteExperimentStore(ExperimentStore):
+    """Local experiment history for offline use.
+
+    Scalar fields get their own columns, metrics stay as JSON without the
+    per-sample arrays, and arrays and plots are stored as compressed blobs.
+    """
+
+    def __init__(self, path='experiments.db'):
+        self.path = path
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS experiments (
+              id text PRIMARY KEY,
+              created_at text NOT NULL,
+              dataset_id text NOT NULL,
+              model_id text NOT NULL,
+              prefix_length integer NOT NULL,
+              performance_retention real NOT NULL,
+              full_accuracy real,
+              prefix_accuracy real,
+              dataset_size integer NOT NULL,
+              train_size integer NOT NULL,
+              test_size integer NOT NULL,
+              label_names text NOT NULL,
+              full_text_metrics text NOT NULL,
+              prefix_metrics text NOT NULL,
+              arrays blob,
+              plots blob
+            );
+            CREATE INDEX IF NOT EXISTS idx_experiments_lookup
+              ON experiments(dataset_id, model_id, prefix_length, created_at);
+            DROP INDEX IF EXISTS idx_experiments_created_at;
+            CREATE INDEX IF NOT EXISTS idx_experiments_keyset
+              ON experiments(created_at, id);
+            CREATE INDEX IF NOT EXISTS idx_experiments_model_prefix
+              ON experiments(model_id, prefix_length, performance_retention, full_accuracy, prefix_accuracy);
+        ''')
+        conn.commit()
+
+    def _to_row(self, experiment_data):
+        full_metrics = experiment_data['full_text_metrics']
+        prefix_metrics = experiment_data['prefix_metrics']
+        return (
+            experiment_data.get('id') or str(uuid.uuid4()),
+            experiment_data.get('created_at') or utc_now(),
+            experiment_data['dataset_id'],
+            experiment_data['model_id'],
+            int(experiment_data['prefix_length']),
+            float(experiment_data['performance_retention']),
+            full_metrics.get('accuracy'),
+            prefix_metrics.get('accuracy'),
+            experiment_data['dataset_size'],
+            experiment_data['train_size'],
+            experiment_data['test_size'],
+            json.dumps(experiment_data['label_names']),
+            json.dumps(strip_arrays(full_metrics)),
+            json.dumps(strip_arrays(prefix_metrics)),
+            pack_arrays(experiment_data),
+            pack_plots(experiment_data.get('plots'))
+        )
+
+    def save_many(self, experiments):
+        rows = [self._to_row(experiment_data) for experiment_data in experiments]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                'INSERT INTO experiments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def _from_row(self, row, include_arrays, include_plots):
+        record = dict(row)
+        for key in ('label_names', 'full_text_metrics', 'prefix_metrics'):
+            if key in record:
+                record[key] = json.loads(record[key])
+        if include_arrays:
+            for name, values in unpack_arrays(record.pop('arrays')).items():
+                section, field = name.split('.', 1)
+                record.setdefault(section, {})[field] = values
+        if include_plots:
+            record['plots'] = unpack_plots(record['plots'])
+        return record
+
+    def _where(self, filters, cursor=None):
+        clauses = []
+        params = []
+        filters = filters or {}
+        for column in FILTER_COLUMNS:
+            if filters.get(column) is not None:
+                clauses.append(f'{column} = ?')
+                params.append(filters[column])
+        since, until = time_range(filters)
+        if since is not None:
+            clauses.append('created_at >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append(until)
+        if cursor is not None:
+            clauses.append('(created_at, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, filters=None, fields=None, limit=100, cursor=None,
+              include_arrays=False, include_plots=False):
+        fields = list(fields or SUMMARY_COLUMNS)
+        validate_fields(fields)
+        validate_limit(limit)
+        # The keyset columns are always read so the next cursor can be built
+        columns = list(dict.fromkeys(['created_at', 'id'] + fields))
+        if include_arrays:
+            columns.append('arrays')
+        if include_plots:
+            columns.append('plots')
+
+        where, params = self._where(filters, cursor)
+        sql = f"SELECT {', '.join(columns)} FROM experiments{where} ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(int(limit))
+
+        rows = self._connect().execute(sql, params).fetchall()
+        records = [self._from_row(row, include_arrays, include_plots) for row in rows]
+        next_cursor = encode_cursor(records[-1]) if records and len(records) == int(limit) else None
+        for record in records:
+            for column in ('created_at', 'id'):
+                if column not in fields:
+                    del record[column]
+        return records, next_cursor
+
+    def get(self, experiment_id, include_arrays=True, include_plots=True):
+        columns = list(SUMMARY_COLUMNS)
+        if include_arrays:
+            columns.append('arrays')
+        if include_plots:
+            columns.append('plots')
+        row = self._connect().execute(
+            f"SELECT {', '.join(columns)} FROM experiments WHERE id = ?", (experiment_id,)
+        ).fetchone()
+        return self._from_row(row, include_arrays, include_plots) if row else None
+
+    def aggregate(self, group_by=('model_id', 'prefix_length'), metric='performance_retention',
+                  filters=None):
+        group_by = list(group_by)
+        validate_aggregate(group_by, metric)
+        where, params = self._where(filters)
+        groups = ', '.join(group_by)
+        sql = (
+            f"SELECT {groups}, COUNT({metric}) AS count, AVG({metric}) AS mean, "
+            f"MIN({metric}) AS min, MAX({metric}) AS max "
+            f"FROM experiments{where} GROUP BY {groups} ORDER BY {groups}"
+        )
+        return [dict(row) for row in self._connect().execute(sql, params).fetchall()]
+
+class SupabaseExperimentStore(ExperimentStore):
+    """Writes to the Supabase `experiments` table, one insert per batch.
+
+    As in the SQLite store, per-sample arrays are stripped from the metrics
+    jsonb and written with the plots as compressed bytea blobs. Rows saved
+    before the blob columns existed keep arrays inline and plots in the
+    `plots` jsonb column, and are read as-is. Reads select individual JSON
+    keys so plots and per-sample arrays are never transferred unless asked for.
+    Aggregation runs in the `aggregate_experiments` database function.
+    """
+
+    # PostgREST page size cap; the aggregation fallback walks the table in pages this big
+    PAGE_SIZE = 1000
+
+    # PostgREST error code for an unknown RPC function
+    MISSING_FUNCTION = 'PGRST202'
+
+    def __init__(self, client):
+        self.client = client
+        self._aggregate_in_database = True
+
+    def _to_row(self, experiment_data):
+        row = {key: value for key, value in experiment_data.items() if key != 'plots'}
+        for section in METRIC_SECTIONS:
+            row[section] = strip_arrays(experiment_data[section])
+        row['arrays'] = to_bytea(pack_arrays(experiment_data))
+        row['plots_blob'] = to_bytea(pack_plots(experiment_data.get('plots')))
+        return row
+
+    def save_many(self, experiments):
+        rows = [self._to_row(experiment_data) for experiment_data in experiments]
+        self.client.table('experiments').insert(rows).execute()
+
+    def _select(self, fields, include_arrays, include_plots):
+        columns = []
+        for field in dict.fromkeys(['created_at', 'id'] + list(fields)):
+            if field == 'full_accuracy':
+                columns.append('full_accuracy:full_text_metrics->accuracy')
+            elif field == 'prefix_accuracy':
+                columns.append('prefix_accuracy:prefix_metrics->accuracy')
+            elif field in METRIC_SECTIONS and not include_arrays:
+                columns.extend(f'{field}__{key}:{field}->{key}' for key in METRIC_KEYS)
+            else:
+                columns.append(field)
+        if include_arrays:
+            columns.append('arrays')
+        if include_plots:
+            columns.extend(['plots', 'plots_blob'])
+        return ','.join(columns)
+
+    def _from_record(self, record, fields):
+        for section in METRIC_SECTIONS:
+            prefix = f'{section}__'
+            keys = [key for key in record if key.startswith(prefix)]
+            if keys:
+                record[section] = {key[len(prefix):]: record.pop(key) for key in keys}
+        if 'arrays' in record:
+            for name, values in unpack_arrays(from_bytea(record.pop('arrays'))).items():
+                section, field = name.split('.', 1)
+                record.setdefault(section, {})[field] = values
+        if 'plots_blob' in record:
+            plots_blob = from_bytea(record.pop('plots_blob'))
+            if plots_blob:
+                record['plots'] = unpack_plots(plots_blob)
+        for column in ('created_at', 'id'):
+            if column not in fields:
+                record.pop(column, None)
+        return record
+
+    def _filtered(self, select, filters, cursor=None):
+        builder = self.client.table('experiments').select(select)
+        filters = filters or {}
+        for column in FILTER_COLUMNS:
+            if filters.get(column) is not None:
+                builder = builder.eq(column, filters[column])
+        since, until = time_range(filters)
+        if since is not None:
+            builder = builder.gte('created_at', since)
+        if until is not None:
+            builder = builder.lt('created_at', until)
+        if cursor is not None:
+            created_at, experiment_id = decode_cursor(cursor)
+            builder = builder.or_(
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{experiment_id})'
+            )
+        return builder
+
+    def query(self, filters=None, fields=None, limit=100, cursor=None,
+              include_arrays=False, include_plots=False):
+        fields = list(fields or SUMMARY_COLUMNS)
+        validate_fields(fields)
+        validate_limit(limit)
+        select = self._select(fields, include_arrays, include_plots)
+        records = (
+            self._filtered(select, filters, cursor)
+            .order('created_at', desc=True)
+            .order('id', desc=True)
+            .limit(int(limit))
+            .execute()
+            .data
+        )
+        next_cursor = encode_cursor(records[-1]) if records and len(records) == int(limit) else None
+        return [self._from_record(record, fields) for record in records], next_cursor
+
+    def get(self, experiment_id, include_arrays=True, include_plots=True):
+        select = self._select(SUMMARY_COLUMNS, include_arrays, include_plots)
+        records = self.client.table('experiments').select(select).eq('id', experiment_id).execute().data
+        return self._from_record(records[0], SUMMARY_COLUMNS) if records else None
+
+    def aggregate(self, group_by=('model_id', 'prefix_length'), metric='performance_retention',
+                  filters=None):
+        group_by = list(group_by)
+        validate_aggregate(group_by, metric)
+        if self._aggregate_in_database:
+            filters = filters or {}
+            since, until = time_range(filters)
+            try:
+                rows = self.client.rpc('aggregate_experiments', {
+                    'metric': metric,
+                    'group_by': group_by,
+                    'filter_dataset_id': filters.get('dataset_id'),
+                    'filter_model_id': filters.get('model_id'),
+                    'filter_prefix_length': filters.get('prefix_length'),
+                    'since': since,
+                    'until': until
+                }).execute().data
+                return [
+                    {**{column: row[column] for column in group_by},
+                     **{key: row[key] for key in ('count', 'mean', 'min', 'max')}}
+                    for row in rows
+                ]
+            except Exception as e:
+                if getattr(e, 'code', None) != self.MISSING_FUNCTION:
+                    raise
+                # Migration not applied yet; stop trying the function
+                self._aggregate_in_database = False
+        return self._aggregate_pages(group_by, metric, filters)
+
+    def _aggregate_pages(self, group_by, metric, filters):
+        """Fallback: transfer only the group and metric columns, a page at a time"""
+        rows = []
+        cursor = None
+        while True:
+            page, cursor = self.query(filters, group_by + [metric], self.PAGE_SIZE, cursor)
+            rows.extend(page)
+            if cursor is None:
+                break
+        return aggregate_rows(rows, group_by, metric)
+
+class BatchingExperimentStore(ExperimentStore):
+    """Queues writes and hands them to the wrapped store in batches from a background thread.
+
+    A batch is written once `batch_size` experiments are queued or
+    `flush_interval` seconds after its first experiment, whichever comes first.
+    """
+
+    def __init__(self, store, batch_size=50, flush_interval=1.0, logger=None):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logger
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='experiment-writer', daemon=True)
+        self._thread.start()
+
+    def save_many(self, experiments):
+        for experiment_data in experiments:
+            self._queue.put(experiment_data)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Don't let a failed write stop later batches
+                self._report_error("Experiment writer failed", e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        """Write a batch in one call; if that fails, retry its experiments one at a time"""
+        store_name = type(self.store).__name__
+        try:
+            self.store.save_many(batch)
+            if self.logger:
+                self.logger.info(f"Saved {len(batch)} experiment(s) to {store_name}")
+            return
+        except Exception as e:
+            self._report_error(
+                f"Failed to save {len(batch)} experiment(s) to {store_name}; retrying one at a time", e
+            )
+
+        saved = 0
+        for experiment_data in batch:
+            try:
+                self.store.save_many([experiment_data])
+                saved += 1
+            except Exception as e:
+                self._report_error(f"Failed to save experiment to {store_name}", e, {
+                    'dataset_id': experiment_data.get('dataset_id'),
+                    'model_id': experiment_data.get('model_id'),
+                    'prefix_length': experiment_data.get('prefix_length')
+                })
+        if self.logger:
+            self.logger.info(f"Saved {saved} of {len(batch)} experiment(s) to {store_name} individually")
+
+    def _report_error(self, message, exception, details=None):
+        if self.logger:
+            self.logger.error(message, exception, details)
+        else:
+            print(f"{message}: {exception}", file=sys.stderr)
+
+    def flush(self):
+        """Block until every queued experiment has been written"""
+        self._queue.join()
+
+    def query(self, *args, **kwargs):
+        return self.store.query(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self.store.get(*args, **kwargs)
+
+    def aggregate(self, *args, **kwargs):
+        return self.store.aggregate(*args, **kwargs)
+
+def create_experiment_store(backend, supabase_client=None, db_path='experiments.db', logger=None):
+    """Build the configured store: 'supabase', 'sqlite', or 'none' to disable persistence"""
+    if backend == 'none':
+        return None
+    if backend == 'supabase':
+        if supabase_client is None:
+            raise ValueError("Supabase experiment store requested but Supabase is not configured")
+        store = SupabaseExperimentStore(supabase_client)
+    elif backend == 'sqlite':
+        store = SQLiteExperimentStore(db_path)
+    else:
+        raise ValueError(f"Unknown experiment store: {backend}")
+    return BatchingExperimentStore(store, logger=logger)
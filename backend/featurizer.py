@@ -0,0 +1,210 @@
+import re
+from array import array
+from itertools import accumulate
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from sklearn.preprocessing import normalize
+
+# Same token pattern as TfidfVectorizer's default
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+class TermIndex:
+    """Sorted terms stored as one concatenated UTF-8 buffer plus offsets.
+
+    Each term costs its encoded length, one offset and a fixed 16-byte sort
+    key (its first bytes), however long the longest term is. UTF-8 byte
+    order matches code point order, so lookups binary-search the sort keys
+    with searchsorted and only compare full terms among those sharing a key.
+    """
+
+    KEY_BYTES = 16
+
+    def __init__(self, terms):
+        encoded = [term.encode('utf-8') for term in terms]
+        self.buffer = b''.join(encoded)
+        self.offsets = array('q', accumulate((len(term) for term in encoded), initial=0))
+        self.keys = np.array([term[:self.KEY_BYTES] for term in encoded], dtype=f'S{self.KEY_BYTES}')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self._encoded(index).decode('utf-8')
+
+    def _encoded(self, index):
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+    @property
+    def nbytes(self):
+        return len(self.buffer) + self.offsets.itemsize * len(self.offsets) + self.keys.nbytes
+
+    def lookup(self, terms):
+        """Index of each term, or -1 for terms not in the index"""
+        encoded = [term.encode('utf-8') for term in terms]
+        starts = np.searchsorted(
+            self.keys, np.array([term[:self.KEY_BYTES] for term in encoded], dtype=f'S{self.KEY_BYTES}')
+        )
+        size = len(self)
+        ids = np.full(len(terms), -1, dtype=np.intc)
+        for i, (term, index) in enumerate(zip(encoded, starts.tolist())):
+            # Terms sharing a sort key are adjacent; scan them for an exact match
+            while index < size:
+                candidate = self._encoded(index)
+                if candidate == term:
+                    ids[i] = index
+                    break
+                if candidate > term or candidate[:self.KEY_BYTES] != term[:self.KEY_BYTES]:
+                    break
+                index += 1
+        return ids
+
+class PrefixFeaturizer:
+    """TF-IDF features for full texts and their prefixes from one tokenization pass.
+
+    Every token is tagged with the index of the whitespace-separated word it
+    came from, so "first N tokens" (as produced by MLPipeline.extract_prefix)
+    is a mask over the already tokenized documents. Full and prefix matrices
+    share one pruned vocabulary, kept as a compact TermIndex; a dict is only
+    used transiently to intern tokens while texts are being tokenized.
+
+    Each matrix is weighted with IDF from its own training documents and only
+    keeps terms those documents contain, which matches a TfidfVectorizer
+    fitted on the same texts whenever min_df/max_df/max_features prune nothing.
+    """
+
+    def __init__(self, max_features=5000, min_df=1, max_df=1.0, stop_words=ENGLISH_STOP_WORDS):
+        self.max_features = max_features
+        self.min_df = min_df
+        self.max_df = max_df
+        self.stop_words = frozenset(stop_words or ())
+        self.vocabulary = None
+
+    def _tokenize(self, texts):
+        """Tokenize texts into flat term id / word position / document id arrays.
+
+        Ids are local to this call; the returned `terms` list (indexed by id)
+        maps them back to strings.
+        """
+        term_index = {}
+        term_ids = array('i')
+        positions = array('i')
+        doc_lengths = array('i')
+        stop_words = self.stop_words
+        intern = term_index.setdefault
+        add_term = term_ids.append
+        add_position = positions.append
+        is_token = TOKEN_PATTERN.fullmatch
+        find_tokens = TOKEN_PATTERN.findall
+        for text in texts:
+            start = len(term_ids)
+            for position, word in enumerate(text.lower().split()):
+                # Most words are a single token; only run findall on the rest
+                tokens = (word,) if is_token(word) else find_tokens(word)
+                for token in tokens:
+                    if token not in stop_words:
+                        add_term(intern(token, len(term_index)))
+                        add_position(position)
+            doc_lengths.append(len(term_ids) - start)
+
+        terms = list(term_index)
+        corpus = {
+            'term_ids': np.frombuffer(term_ids, dtype=np.intc),
+            'positions': np.frombuffer(positions, dtype=np.intc),
+            'doc_ids': np.repeat(
+                np.arange(len(doc_lengths), dtype=np.intc), np.frombuffer(doc_lengths, dtype=np.intc)
+            ),
+            'n_docs': len(doc_lengths)
+        }
+        return terms, corpus
+
+    def _doc_count_limit(self, value, n_docs):
+        return value if isinstance(value, (int, np.integer)) else value * n_docs
+
+    def _prune(self, terms, corpus):
+        """Return ids of the terms kept after min_df/max_df/max_features pruning, in term order"""
+        n_terms = len(terms)
+        term_ids, doc_ids, n_docs = corpus['term_ids'], corpus['doc_ids'], corpus['n_docs']
+
+        term_freq = np.bincount(term_ids, minlength=n_terms)
+        # Document frequency: building the CSR matrix merges repeated (document, term) pairs
+        counts = sp.csr_matrix(
+            (np.ones(len(term_ids), dtype=np.int32), (doc_ids, term_ids)), shape=(n_docs, n_terms)
+        )
+        doc_freq = np.bincount(counts.indices, minlength=n_terms)
+
+        keep = (
+            (doc_freq >= self._doc_count_limit(self.min_df, n_docs))
+            & (doc_freq <= self._doc_count_limit(self.max_df, n_docs))
+        )
+        kept = np.array(sorted(np.flatnonzero(keep).tolist(), key=terms.__getitem__), dtype=np.intp)
+        if self.max_features is not None and len(kept) > self.max_features:
+            # Most frequent terms first, ties broken by term order
+            top = np.argsort(-term_freq[kept], kind='stable')[:self.max_features]
+            kept = kept[np.sort(top)]
+        return kept
+
+    def fit_tokenize(self, texts):
+        """Build the vocabulary from training texts and return them tokenized"""
+        terms, corpus = self._tokenize(texts)
+        kept = self._prune(terms, corpus)
+        if len(kept) == 0:
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+        self.vocabulary = TermIndex([terms[i] for i in kept])
+
+        remap = np.full(len(terms), -1, dtype=np.intc)
+        remap[kept] = np.arange(len(kept), dtype=np.intc)
+        return self._select(corpus, remap)
+
+    def tokenize(self, texts):
+        """Tokenize texts against the fitted vocabulary, dropping unknown terms"""
+        terms, corpus = self._tokenize(texts)
+        return self._select(corpus, self.vocabulary.lookup(terms))
+
+    def _select(self, corpus, remap):
+        """Map call-local term ids to vocabulary ids, dropping terms outside the vocabulary"""
+        term_ids = remap[corpus['term_ids']]
+        keep = term_ids >= 0
+        return {
+            'term_ids': term_ids[keep],
+            'positions': corpus['positions'][keep],
+            'doc_ids': corpus['doc_ids'][keep],
+            'n_docs': corpus['n_docs']
+        }
+
+    def _counts(self, corpus, n_tokens):
+        """Term count matrix, limited to the first n_tokens words when given"""
+        term_ids, doc_ids = corpus['term_ids'], corpus['doc_ids']
+        # Mirrors MLPipeline.extract_prefix, which falls back to the full text for empty prefixes
+        if n_tokens is not None and n_tokens > 0:
+            mask = corpus['positions'] < n_tokens
+            term_ids, doc_ids = term_ids[mask], doc_ids[mask]
+        # Duplicate (document, term) entries are summed on conversion to CSR
+        return sp.csr_matrix(
+            (np.ones(len(term_ids), dtype=np.float64), (doc_ids, term_ids)),
+            shape=(corpus['n_docs'], len(self.vocabulary))
+        )
+
+    def vectorize(self, train_corpus, test_corpus, n_tokens=None):
+        """Return (X_train, X_test) TF-IDF matrices for full texts or their first n_tokens words"""
+        if n_tokens is not None and n_tokens < 0:
+            raise ValueError("prefix length must not be negative")
+        X_train = self._counts(train_corpus, n_tokens)
+        X_test = self._counts(test_corpus, n_tokens)
+
+        doc_freq = np.bincount(X_train.indices, minlength=X_train.shape[1])
+        present = np.flatnonzero(doc_freq)
+        if len(present) < X_train.shape[1]:
+            # A vectorizer fitted on these documents would not know the missing terms
+            X_train = X_train[:, present]
+            X_test = X_test[:, present]
+            doc_freq = doc_freq[present]
+
+        # Smoothed IDF, as TfidfVectorizer computes it
+        n_docs = train_corpus['n_docs']
+        idf = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+        X_train.data *= idf[X_train.indices]
+        X_test.data *= idf[X_test.indices]
+
+        return normalize(X_train, copy=False), normalize(X_test, copy=False)
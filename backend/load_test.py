@@ -0,0 +1,100 @@
+"""Simple load generator for comparing serving modes.
+
+Fires requests at one endpoint from a number of concurrent clients and reports
+throughput and latency percentiles. Optionally keeps training requests running
+in the background, which is where the Flask dev server and the ASGI server
+differ most.
+
+Examples:
+    python load_test.py --url http://localhost:5000 --path /api/health
+    python load_test.py --path /api/datasets --background 4
+    python load_test.py --method POST --path /api/experiment \
+        --body '{"dataset": "imdb", "model": "logistic", "prefixLength": 20}'
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+BACKGROUND_BODY = {'dataset': 'imdb', 'model': 'logistic', 'prefixLength': 20}
+
+def send(url, method, body, timeout):
+    """Send one request and return (status, seconds)"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method,
+                                 headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 'error'
+    return status, time.perf_counter() - start
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def background_load(url, stop, timeout):
+    """Keep one training request in flight until stopped"""
+    while not stop.is_set():
+        send(url + '/api/experiment', 'POST', BACKGROUND_BODY, timeout)
+
+def run(args):
+    url = args.url.rstrip('/')
+    body = json.loads(args.body) if args.body else None
+
+    stop = threading.Event()
+    background = [
+        threading.Thread(target=background_load, args=(url, stop, args.timeout), daemon=True)
+        for _ in range(args.background)
+    ]
+    for thread in background:
+        thread.start()
+    if background:
+        # Let the training requests reach the server before measuring
+        time.sleep(1.0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(
+            lambda _: send(url + args.path, args.method, body, args.timeout),
+            range(args.requests)
+        ))
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    latencies = sorted(seconds for _, seconds in results)
+    statuses = Counter(status for status, _ in results)
+
+    print(f"{args.method} {args.path}: {args.requests} requests, "
+          f"concurrency={args.concurrency}, background={args.background}")
+    print(f"  requests/sec: {args.requests / elapsed:.1f}")
+    print(f"  p50 latency:  {percentile(latencies, 50) * 1000:.1f} ms")
+    print(f"  p99 latency:  {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  statuses:     {dict(statuses)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--path', default='/api/health')
+    parser.add_argument('--method', default='GET')
+    parser.add_argument('--body', default=None, help='JSON request body')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--background', type=int, default=0,
+                        help='number of clients continuously running /api/experiment')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    run(parser.parse_args())
+
+if __name__ == '__main__':
+    main()
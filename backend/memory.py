@@ -0,0 +1,178 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+MB = 1024 * 1024
+
+def _read_hwm():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    raise OSError("VmHWM not reported")
+
+def _lifetime_peak():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class MemoryTracker:
+    """Peak resident memory per pipeline stage, plus matrix cache statistics.
+
+    Peaks are process-wide. With `exclusive` set (the job has its process to
+    itself, as in the ASGI process pool) the kernel's high-water mark is
+    reset at the start of each stage via /proc/self/clear_refs on Linux, so
+    every stage reports its own peak. Otherwise resetting would wipe the peak
+    of concurrent jobs sharing the process (e.g. threads of the Flask
+    server), so each stage reports the process-lifetime peak so far instead
+    and the report is flagged as `shared`: an upper bound that includes other
+    jobs' usage. Peaks are None where neither source is available.
+    """
+
+    def __init__(self, exclusive=False, cache_budget_mb=None):
+        self.exclusive = exclusive
+        self.cache_budget_mb = cache_budget_mb
+        self.stages = {}
+        self.peak = None
+        self.cache_peak = 0
+        self.spilled_bytes = 0
+        self.spilled_pairs = 0
+
+    def _reset_peak(self):
+        if not self.exclusive:
+            return False
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            return True
+        except OSError:
+            return False
+
+    def _stage_peak(self, resettable):
+        if resettable:
+            try:
+                return _read_hwm()
+            except (OSError, ValueError):
+                pass
+        return _lifetime_peak()
+
+    @contextmanager
+    def stage(self, name):
+        resettable = self._reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            peak = self._stage_peak(resettable)
+            entry = self.stages.setdefault(name, {'peak_mb': None, 'seconds': 0.0, 'runs': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['runs'] += 1
+            if peak is not None:
+                entry['peak_mb'] = max(entry['peak_mb'] or 0.0, peak / MB)
+                self.peak = max(self.peak or 0, peak)
+
+    def report(self):
+        return {
+            'peak_mb': self.peak / MB if self.peak is not None else None,
+            'shared': not self.exclusive,
+            'stages': {name: dict(entry) for name, entry in self.stages.items()},
+            'matrix_cache': {
+                'budget_mb': self.cache_budget_mb,
+                'peak_mb': self.cache_peak / MB,
+                'spilled_pairs': self.spilled_pairs,
+                'spilled_mb': self.spilled_bytes / MB
+            }
+        }
+
+def matrix_nbytes(matrix):
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+class MatrixCache:
+    """Holds cached (X_train, X_test) sparse matrix pairs within a byte budget.
+
+    The budget (the tracker's cache_budget_mb) covers the matrices the cache
+    holds in memory, not the whole process. When an insert takes it over,
+    the largest in-memory entries are written to a temporary directory and
+    replaced by read-only memory-mapped CSR matrices, so the OS pages them in
+    only while a model is being fitted on them.
+    """
+
+    def __init__(self, tracker, spill_dir=None):
+        self.tracker = tracker
+        self.spill_dir = spill_dir
+        self._entries = {}
+        self._spilled = {}
+        self._resident = {}
+        self._directory = None
+        self._next_id = 0
+
+    def resident_bytes(self):
+        return sum(self._resident.values())
+
+    def put(self, key, matrices):
+        self.release(key)
+        self._entries[key] = matrices
+        self._resident[key] = sum(matrix_nbytes(matrix) for matrix in matrices)
+
+        budget_mb = self.tracker.cache_budget_mb
+        if budget_mb:
+            while self._resident and self.resident_bytes() > budget_mb * MB:
+                self._spill(max(self._resident, key=self._resident.get))
+        # Measured after spilling: what the cache keeps in memory between inserts
+        self.tracker.cache_peak = max(self.tracker.cache_peak, self.resident_bytes())
+
+    def get(self, key):
+        return self._entries[key]
+
+    def release(self, key):
+        self._entries.pop(key, None)
+        self._resident.pop(key, None)
+        path = self._spilled.pop(key, None)
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _spill(self, key):
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='ml-matrices-', dir=self.spill_dir)
+        path = os.path.join(self._directory, str(self._next_id))
+        self._next_id += 1
+        os.makedirs(path)
+
+        mapped = []
+        for index, matrix in enumerate(self._entries[key]):
+            matrix = sp.csr_matrix(matrix)
+            parts = {}
+            for name in ('data', 'indices', 'indptr'):
+                filename = os.path.join(path, f'{index}.{name}.npy')
+                np.save(filename, getattr(matrix, name))
+                parts[name] = np.load(filename, mmap_mode='r')
+            mapped.append(sp.csr_matrix(
+                (parts['data'], parts['indices'], parts['indptr']), shape=matrix.shape, copy=False
+            ))
+
+        self._entries[key] = tuple(mapped)
+        self._spilled[key] = path
+        self.tracker.spilled_bytes += self._resident.pop(key)
+        self.tracker.spilled_pairs += 1
+
+    def close(self):
+        self._entries.clear()
+        self._resident.clear()
+        self._spilled.clear()
+        if self._directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
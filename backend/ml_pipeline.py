@@ -1,7 +1,6 @@
 import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.svm import LinearSVC
@@ -11,16 +10,29 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import seaborn as sns
 from io import BytesIO
+from collections import Counter
+import os
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
 from realistic_data import RealisticDataLoader
+from featurizer import PrefixFeaturizer
+from memory import MatrixCache, MemoryTracker
+
+# MB of vectorized matrices a batch keeps in memory before spilling them to disk; unset means no limit
+MATRIX_CACHE_MB = float(os.environ.get('ML_MATRIX_CACHE_MB', 0)) or None
 
 class MLPipeline:
-    def __init__(self):
+    TOKEN_COUNTS = [5, 10, 20, 30, 50, 75, 100, 150, 200, -1]  # -1 means full text
+
+    def __init__(self, matrix_cache_mb=MATRIX_CACHE_MB, spill_dir=None, exclusive=False):
         self.data_loader = RealisticDataLoader()
-        self.vectorizer_full = None
-        self.vectorizer_prefix = None
+        self.matrix_cache_mb = matrix_cache_mb
+        self.spill_dir = spill_dir
+        # Set when this pipeline runs one job at a time in a process of its own
+        self.exclusive = exclusive
+        self.featurizer = None
         self.model_full = None
         self.model_prefix = None
 
@@ -34,7 +46,11 @@ class MLPipeline:
         return models.get(model_id, LogisticRegression(max_iter=1000, random_state=42))
 
     def extract_prefix(self, texts, n_tokens):
-        """Extract first N tokens from texts"""
+        """Extract first N tokens from texts.
+
+        Reference for PrefixFeaturizer, which derives the same prefixes from
+        one tokenization pass (see test_featurizer.py).
+        """
         prefixes = []
         for text in texts:
             tokens = text.split()
@@ -140,42 +156,36 @@ class MLPipeline:
 
         return buf.getvalue()
 
-    def run_experiment(self, dataset_id, model_id, prefix_length):
-        """Run complete experiment comparing full text vs prefix"""
-        # Load data
+    def track_memory(self):
+        """New per-run memory tracker using this pipeline's matrix cache budget"""
+        return MemoryTracker(self.exclusive, self.matrix_cache_mb)
+
+    def load_split(self, dataset_id):
+        """Load a dataset and split it into stratified train/test sets"""
         texts, labels, label_names = self.data_loader.load_dataset(dataset_id)
 
-        # Split data
-        X_train_full, X_test_full, y_train, y_test = train_test_split(
+        X_train, X_test, y_train, y_test = train_test_split(
             texts, labels, test_size=0.2, random_state=42, stratify=labels
         )
 
-        # Extract prefixes
-        X_train_prefix = self.extract_prefix(X_train_full, prefix_length)
-        X_test_prefix = self.extract_prefix(X_test_full, prefix_length)
-
-        # Vectorize full text
-        self.vectorizer_full = TfidfVectorizer(max_features=5000, stop_words='english')
-        X_train_full_vec = self.vectorizer_full.fit_transform(X_train_full)
-        X_test_full_vec = self.vectorizer_full.transform(X_test_full)
-
-        # Vectorize prefix text
-        self.vectorizer_prefix = TfidfVectorizer(max_features=5000, stop_words='english')
-        X_train_prefix_vec = self.vectorizer_prefix.fit_transform(X_train_prefix)
-        X_test_prefix_vec = self.vectorizer_prefix.transform(X_test_prefix)
-
-        # Train and evaluate full text model
-        model_full = self.get_model(model_id)
-        full_metrics = self.train_and_evaluate(
-            X_train_full_vec, X_test_full_vec, y_train, y_test, model_full
-        )
+        return {
+            'X_train': X_train,
+            'X_test': X_test,
+            'y_train': y_train,
+            'y_test': y_test,
+            'label_names': label_names,
+            'dataset_size': len(texts)
+        }
 
-        # Train and evaluate prefix model
-        model_prefix = self.get_model(model_id)
-        prefix_metrics = self.train_and_evaluate(
-            X_train_prefix_vec, X_test_prefix_vec, y_train, y_test, model_prefix
-        )
+    def featurize(self, split):
+        """Tokenize both splits once; full and prefix matrices are derived from the result"""
+        featurizer = PrefixFeaturizer(max_features=5000)
+        train_tokens = featurizer.fit_tokenize(split['X_train'])
+        test_tokens = featurizer.tokenize(split['X_test'])
+        return featurizer, train_tokens, test_tokens
 
+    def build_experiment_result(self, split, full_metrics, prefix_metrics, prefix_length):
+        """Assemble the experiment response (retention and plots) from both metric sets"""
         # Calculate performance retention
         performance_retention = (prefix_metrics['accuracy'] / full_metrics['accuracy']) * 100
 
@@ -185,13 +195,13 @@ class MLPipeline:
         cm_full_plot = self.create_confusion_matrix_plot(
             np.array(full_metrics['confusion_matrix']),
             'Confusion Matrix - Full Text',
-            label_names
+            split['label_names']
         )
 
         cm_prefix_plot = self.create_confusion_matrix_plot(
             np.array(prefix_metrics['confusion_matrix']),
             f'Confusion Matrix - First {prefix_length} Tokens',
-            label_names
+            split['label_names']
         )
 
         return {
@@ -199,10 +209,10 @@ class MLPipeline:
             'prefix': prefix_metrics,
             'performance_retention': float(performance_retention),
             'prefix_length': prefix_length,
-            'dataset_size': len(texts),
-            'train_size': len(X_train_full),
-            'test_size': len(X_test_full),
-            'label_names': label_names,
+            'dataset_size': split['dataset_size'],
+            'train_size': len(split['X_train']),
+            'test_size': len(split['X_test']),
+            'label_names': split['label_names'],
             'plots': {
                 'comparison': comparison_plot,
                 'confusion_full': cm_full_plot,
@@ -210,35 +220,243 @@ class MLPipeline:
             }
         }
 
-    def compare_token_counts(self, dataset_id, model_id):
-        """Compare model performance across different token counts"""
-        texts, labels, label_names = self.data_loader.load_dataset(dataset_id)
-
-        X_train, X_test, y_train, y_test = train_test_split(
-            texts, labels, test_size=0.2, random_state=42, stratify=labels
-        )
+    def run_experiment(self, dataset_id, model_id, prefix_length):
+        """Run complete experiment comparing full text vs prefix"""
+        memory = self.track_memory()
+
+        # Load and split data
+        with memory.stage('load'):
+            split = self.load_split(dataset_id)
+        y_train, y_test = split['y_train'], split['y_test']
+
+        # Tokenize once for both full text and prefix
+        with memory.stage('tokenize'):
+            self.featurizer, train_tokens, test_tokens = self.featurize(split)
+
+        # Vectorize, train and evaluate full text model
+        with memory.stage('vectorize_full'):
+            X_train_full_vec, X_test_full_vec = self.featurizer.vectorize(train_tokens, test_tokens)
+
+        with memory.stage('train_full'):
+            model_full = self.get_model(model_id)
+            full_metrics = self.train_and_evaluate(
+                X_train_full_vec, X_test_full_vec, y_train, y_test, model_full
+            )
+        # Only one set of matrices is alive at a time
+        del X_train_full_vec, X_test_full_vec, model_full
+
+        # Vectorize, train and evaluate prefix model
+        with memory.stage('vectorize_prefix'):
+            X_train_prefix_vec, X_test_prefix_vec = self.featurizer.vectorize(
+                train_tokens, test_tokens, prefix_length
+            )
+        del train_tokens, test_tokens
+
+        with memory.stage('train_prefix'):
+            model_prefix = self.get_model(model_id)
+            prefix_metrics = self.train_and_evaluate(
+                X_train_prefix_vec, X_test_prefix_vec, y_train, y_test, model_prefix
+            )
+        del X_train_prefix_vec, X_test_prefix_vec, model_prefix
+
+        with memory.stage('plots'):
+            result = self.build_experiment_result(split, full_metrics, prefix_metrics, prefix_length)
+        result['memory'] = memory.report()
+        return result
+
+    def plan_experiment_batch(self, dataset_ids, model_ids, prefix_lengths):
+        """Plan a grid of experiments as a DAG of shared stages.
+
+        Every stage appears exactly once: one load/split and one tokenization
+        per dataset, one vectorization per (dataset, prefix length) plus the
+        full text, one full-text baseline per (dataset, model) and one prefix
+        fit per cell. Stages are listed in dependency order so they can be
+        executed as-is; each stage's 'key' is what dependents list in 'deps'.
+        """
+        for values in (dataset_ids, model_ids, prefix_lengths):
+            # A bare string would otherwise be planned one character at a time
+            if isinstance(values, str):
+                raise ValueError(f"Expected a list of values, got {values!r}")
+
+        # Deduplicate while preserving request order
+        dataset_ids = list(dict.fromkeys(dataset_ids))
+        model_ids = list(dict.fromkeys(model_ids))
+        prefix_lengths = list(dict.fromkeys(int(n) for n in prefix_lengths))
+
+        stages = []
+        for dataset_id in dataset_ids:
+            stages.append({
+                'stage': 'load', 'dataset': dataset_id,
+                'key': ('load', dataset_id), 'deps': []
+            })
+            stages.append({
+                'stage': 'tokenize', 'dataset': dataset_id,
+                'key': ('tokenize', dataset_id), 'deps': [('load', dataset_id)]
+            })
+            stages.append({
+                'stage': 'vectorize', 'dataset': dataset_id, 'prefix_length': None,
+                'key': ('vectorize', dataset_id, None), 'deps': [('tokenize', dataset_id)]
+            })
+            for model_id in model_ids:
+                stages.append({
+                    'stage': 'baseline', 'dataset': dataset_id, 'model': model_id,
+                    'key': ('baseline', dataset_id, model_id),
+                    'deps': [('load', dataset_id), ('vectorize', dataset_id, None)]
+                })
+            for prefix_length in prefix_lengths:
+                stages.append({
+                    'stage': 'vectorize', 'dataset': dataset_id, 'prefix_length': prefix_length,
+                    'key': ('vectorize', dataset_id, prefix_length),
+                    'deps': [('tokenize', dataset_id)]
+                })
+                for model_id in model_ids:
+                    stages.append({
+                        'stage': 'cell', 'dataset': dataset_id, 'model': model_id,
+                        'prefix_length': prefix_length,
+                        'key': None,
+                        'deps': [
+                            ('load', dataset_id),
+                            ('baseline', dataset_id, model_id),
+                            ('vectorize', dataset_id, prefix_length)
+                        ]
+                    })
+        return stages
+
+    def run_experiment_batch(self, dataset_ids, model_ids, prefix_lengths):
+        """Run a grid of experiments, yielding each cell's result as it finishes.
+
+        Every intermediate is released as soon as the last stage depending on
+        it has run. Vectorized matrices live in a MatrixCache, which spills
+        them to disk once they exceed the matrix cache budget. Each result's
+        'memory' entry reports usage for the batch so far.
+        """
+        stages = self.plan_experiment_batch(dataset_ids, model_ids, prefix_lengths)
+        remaining = Counter(dep for stage in stages for dep in stage['deps'])
+        outputs = {}
+        memory = self.track_memory()
+        matrices = MatrixCache(memory, self.spill_dir)
+
+        try:
+            for stage in stages:
+                dataset_id = stage['dataset']
+                key = stage['key']
+
+                with memory.stage(stage['stage']):
+                    if stage['stage'] == 'load':
+                        outputs[key] = self.load_split(dataset_id)
+
+                    elif stage['stage'] == 'tokenize':
+                        outputs[key] = self.featurize(outputs[('load', dataset_id)])
+
+                    elif stage['stage'] == 'vectorize':
+                        featurizer, train_tokens, test_tokens = outputs[('tokenize', dataset_id)]
+                        matrices.put(key, featurizer.vectorize(
+                            train_tokens, test_tokens, stage['prefix_length']
+                        ))
+
+                    elif stage['stage'] == 'baseline':
+                        split = outputs[('load', dataset_id)]
+                        X_train_vec, X_test_vec = matrices.get(('vectorize', dataset_id, None))
+                        outputs[key] = self.train_and_evaluate(
+                            X_train_vec, X_test_vec, split['y_train'], split['y_test'],
+                            self.get_model(stage['model'])
+                        )
+
+                    elif stage['stage'] == 'cell':
+                        split = outputs[('load', dataset_id)]
+                        model_id = stage['model']
+                        prefix_length = stage['prefix_length']
+                        X_train_vec, X_test_vec = matrices.get(('vectorize', dataset_id, prefix_length))
+                        prefix_metrics = self.train_and_evaluate(
+                            X_train_vec, X_test_vec, split['y_train'], split['y_test'],
+                            self.get_model(model_id)
+                        )
+                        result = self.build_experiment_result(
+                            split, outputs[('baseline', dataset_id, model_id)],
+                            prefix_metrics, prefix_length
+                        )
+                        result['dataset'] = dataset_id
+                        result['model'] = model_id
+
+                # Local references would otherwise keep released matrices alive
+                X_train_vec = X_test_vec = None
+                # Release intermediates no remaining stage depends on
+                for dep in stage['deps']:
+                    remaining[dep] -= 1
+                    if remaining[dep] == 0:
+                        outputs.pop(dep, None)
+                        matrices.release(dep)
+
+                if stage['stage'] == 'cell':
+                    result['memory'] = memory.report()
+                    yield result
+        finally:
+            matrices.close()
+
+    def iter_token_counts(self, dataset_id, model_id, memory=None):
+        """Yield accuracy and stage timings for each token count as it completes.
+
+        Pass a MemoryTracker as `memory` to collect per-stage peak usage.
+        """
+        memory = memory or self.track_memory()
+        with memory.stage('load'):
+            split = self.load_split(dataset_id)
+        y_train, y_test = split['y_train'], split['y_test']
+
+        # Every token count is derived from this single tokenization
+        with memory.stage('tokenize'):
+            featurizer, train_tokens, test_tokens = self.featurize(split)
+
+        for n_tokens in self.TOKEN_COUNTS:
+            start = time.perf_counter()
+            with memory.stage('vectorize'):
+                X_train_vec, X_test_vec = featurizer.vectorize(
+                    train_tokens, test_tokens, n_tokens if n_tokens != -1 else None
+                )
+            vectorized = time.perf_counter()
+
+            with memory.stage('train'):
+                model = self.get_model(model_id)
+                model.fit(X_train_vec, y_train)
+                fitted = time.perf_counter()
+                y_pred = model.predict(X_test_vec)
 
-        token_counts = [5, 10, 20, 30, 50, 75, 100, 150, 200, -1]  # -1 means full text
-        accuracies = []
+            accuracy = accuracy_score(y_test, y_pred)
+            finished = time.perf_counter()
+            # Drop this count's matrices before the next ones are built
+            del X_train_vec, X_test_vec, model
+
+            yield {
+                'token_count': n_tokens if n_tokens != -1 else 'Full',
+                'accuracy': float(accuracy),
+                'timings': {
+                    'vectorize_seconds': vectorized - start,
+                    'fit_seconds': fitted - vectorized,
+                    'predict_seconds': finished - fitted,
+                    'total_seconds': finished - start
+                }
+            }
 
-        for n_tokens in token_counts:
-            if n_tokens == -1:
-                X_train_current = X_train
-                X_test_current = X_test
-            else:
-                X_train_current = self.extract_prefix(X_train, n_tokens)
-                X_test_current = self.extract_prefix(X_test, n_tokens)
+    def compare_token_counts(self, dataset_id, model_id):
+        """Compare model performance across different token counts"""
+        memory = self.track_memory()
+        accuracies = [
+            step['accuracy'] for step in self.iter_token_counts(dataset_id, model_id, memory)
+        ]
 
-            vectorizer = TfidfVectorizer(max_features=5000, stop_words='english')
-            X_train_vec = vectorizer.fit_transform(X_train_current)
-            X_test_vec = vectorizer.transform(X_test_current)
+        with memory.stage('plots'):
+            plot = self.create_token_count_plot(accuracies)
 
-            model = self.get_model(model_id)
-            model.fit(X_train_vec, y_train)
-            y_pred = model.predict(X_test_vec)
+        return {
+            'token_counts': [t if t != -1 else 'Full' for t in self.TOKEN_COUNTS],
+            'accuracies': accuracies,
+            'plot': plot,
+            'memory': memory.report()
+        }
 
-            accuracy = accuracy_score(y_test, y_pred)
-            accuracies.append(float(accuracy))
+    def create_token_count_plot(self, accuracies):
+        """Create bar chart of accuracy per token count"""
+        token_counts = self.TOKEN_COUNTS
 
         # Create plot
         fig, ax = plt.subplots(figsize=(12, 6))
@@ -268,8 +486,4 @@ class MLPipeline:
         buf.seek(0)
         plt.close()
 
-        return {
-            'token_counts': [t if t != -1 else 'Full' for t in token_counts],
-            'accuracies': accuracies,
-            'plot': buf.getvalue()
-        }
+        return buf.getvalue()
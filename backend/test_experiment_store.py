@@ -0,0 +1,166 @@
+import base64
+
+import numpy as np
+import pytest
+
+from experiment_store import (
+    BatchingExperimentStore, ExperimentStore, SQLiteExperimentStore, normalize_timestamp,
+    pack_arrays, pack_plots, unpack_arrays, unpack_plots
+)
+
+def make_experiment(**overrides):
+    experiment = {
+        'dataset_id': 'imdb',
+        'model_id': 'logistic',
+        'prefix_length': 10,
+        'full_text_metrics': {
+            'accuracy': 0.9,
+            'predictions': [0, 1, 1, 0],
+            'true_labels': [0, 1, 0, 0]
+        },
+        'prefix_metrics': {
+            'accuracy': 0.8,
+            'predictions': [1, 1, 1, 0],
+            'true_labels': [0, 1, 0, 0]
+        },
+        'performance_retention': 88.9,
+        'dataset_size': 20,
+        'train_size': 16,
+        'test_size': 4,
+        'label_names': ['negative', 'positive'],
+        'plots': {}
+    }
+    experiment.update(overrides)
+    return experiment
+
+def test_pack_arrays_round_trip():
+    experiment = make_experiment()
+    experiment['prefix_metrics']['predictions'] = [0, 300, 70000, 2]
+
+    arrays = unpack_arrays(pack_arrays(experiment))
+
+    assert arrays == {
+        'full_text_metrics.predictions': [0, 1, 1, 0],
+        'full_text_metrics.true_labels': [0, 1, 0, 0],
+        'prefix_metrics.predictions': [0, 300, 70000, 2],
+        'prefix_metrics.true_labels': [0, 1, 0, 0]
+    }
+
+def test_pack_arrays_without_arrays():
+    experiment = make_experiment(full_text_metrics={'accuracy': 1.0}, prefix_metrics={'accuracy': 1.0})
+    assert pack_arrays(experiment) is None
+    assert unpack_arrays(None) == {}
+
+def test_pack_plots_round_trip():
+    rng = np.random.default_rng(0)
+    plots = {
+        'comparison': base64.b64encode(b'\x89PNG' + rng.bytes(1000)).decode('utf-8'),
+        'confusion_full': base64.b64encode(b'').decode('utf-8')
+    }
+    assert unpack_plots(pack_plots(plots)) == plots
+    assert pack_plots({}) is None
+
+class FlakyStore(ExperimentStore):
+    """Fails every multi-row write and any write of a 'bad' experiment"""
+
+    def __init__(self):
+        self.saved = []
+
+    def save_many(self, experiments):
+        experiments = list(experiments)
+        if len(experiments) > 1 or experiments[0]['model_id'] == 'bad':
+            raise RuntimeError("write failed")
+        self.saved.extend(experiments)
+
+class RecordingLogger:
+    def __init__(self):
+        self.errors = []
+
+    def info(self, message, details=None):
+        pass
+
+    def error(self, message, exception=None, details=None):
+        self.errors.append((message, details))
+
+def test_failed_batch_is_retried_one_at_a_time():
+    store = FlakyStore()
+    logger = RecordingLogger()
+    batching = BatchingExperimentStore(store, batch_size=3, flush_interval=5.0, logger=logger)
+
+    batching.save_many([
+        make_experiment(model_id='logistic'),
+        make_experiment(model_id='bad'),
+        make_experiment(model_id='svm')
+    ])
+    batching.flush()
+
+    assert [experiment['model_id'] for experiment in store.saved] == ['logistic', 'svm']
+    # One error for the batch, one for the experiment that still failed
+    assert len(logger.errors) == 2
+    assert logger.errors[1][1]['model_id'] == 'bad'
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    return SQLiteExperimentStore(str(tmp_path / 'experiments.db'))
+
+def test_keyset_pagination_with_identical_timestamps(sqlite_store):
+    created_at = '2025-11-01T10:00:00.000000+00:00'
+    ids = [f'00000000-0000-0000-0000-00000000000{i}' for i in range(7)]
+    sqlite_store.save_many([make_experiment(id=id_, created_at=created_at) for id_ in ids])
+
+    pages = []
+    cursor = None
+    while True:
+        records, cursor = sqlite_store.query(fields=['id'], limit=3, cursor=cursor)
+        pages.append([record['id'] for record in records])
+        if cursor is None:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == sorted(ids, reverse=True)
+
+def test_exact_page_ends_without_cursor_error(sqlite_store):
+    sqlite_store.save_many([make_experiment() for _ in range(2)])
+    records, cursor = sqlite_store.query(limit=2)
+    assert len(records) == 2
+    records, cursor = sqlite_store.query(limit=2, cursor=cursor)
+    assert records == [] and cursor is None
+
+@pytest.mark.parametrize('limit', [0, -1])
+def test_non_positive_limit_is_rejected(sqlite_store, limit):
+    with pytest.raises(ValueError):
+        sqlite_store.query(limit=limit)
+
+def test_time_filters_are_compared_as_times(sqlite_store):
+    sqlite_store.save_many([
+        make_experiment(model_id='early', created_at='2025-11-01T09:59:59.900000+00:00'),
+        make_experiment(model_id='half_past', created_at='2025-11-01T10:00:00.500000+00:00'),
+        make_experiment(model_id='late', created_at='2025-11-01T12:30:00.000000+00:00')
+    ])
+
+    def models(**filters):
+        records, _ = sqlite_store.query(filters=filters, fields=['model_id'])
+        return sorted(record['model_id'] for record in records)
+
+    assert models(since='2025-11-01T10:00:00Z') == ['half_past', 'late']
+    # 12:00 at +02:00 is 10:00 UTC
+    assert models(since='2025-11-01T12:00:00+02:00') == ['half_past', 'late']
+    assert models(until='2025-11-01T10:00:00') == ['early']
+    with pytest.raises(ValueError):
+        models(since='yesterday')
+
+def test_normalize_timestamp():
+    assert normalize_timestamp('2025-11-01T12:00:00+02:00') == '2025-11-01T10:00:00.000000+00:00'
+    assert normalize_timestamp('2025-11-01') == '2025-11-01T00:00:00.000000+00:00'
+
+def test_sqlite_aggregate(sqlite_store):
+    sqlite_store.save_many([
+        make_experiment(performance_retention=80.0),
+        make_experiment(performance_retention=90.0),
+        make_experiment(model_id='svm', performance_retention=70.0)
+    ])
+    groups = sqlite_store.aggregate(group_by=['model_id'])
+    assert groups == [
+        {'model_id': 'logistic', 'count': 2, 'mean': 85.0, 'min': 80.0, 'max': 90.0},
+        {'model_id': 'svm', 'count': 1, 'mean': 70.0, 'min': 70.0, 'max': 70.0}
+    ]
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from featurizer import PrefixFeaturizer, TermIndex
+from ml_pipeline import MLPipeline
+
+PREFIX_LENGTHS = [None, 1, 5, 20, 50]
+
+@pytest.fixture(scope='module')
+def pipeline():
+    return MLPipeline()
+
+def reference_matrices(pipeline, split, n_tokens):
+    """TF-IDF matrices from a TfidfVectorizer fitted on extract_prefix output"""
+    X_train, X_test = split['X_train'], split['X_test']
+    if n_tokens is not None:
+        X_train = pipeline.extract_prefix(X_train, n_tokens)
+        X_test = pipeline.extract_prefix(X_test, n_tokens)
+    vectorizer = TfidfVectorizer(max_features=5000, stop_words='english')
+    return vectorizer.fit_transform(X_train), vectorizer.transform(X_test), vectorizer
+
+@pytest.mark.parametrize('dataset_id', ['imdb', 'news'])
+def test_matches_tfidf_vectorizer(pipeline, dataset_id):
+    split = pipeline.load_split(dataset_id)
+    featurizer, train_tokens, test_tokens = pipeline.featurize(split)
+
+    for n_tokens in PREFIX_LENGTHS:
+        X_train, X_test = featurizer.vectorize(train_tokens, test_tokens, n_tokens)
+        ref_train, ref_test, vectorizer = reference_matrices(pipeline, split, n_tokens)
+        # Equivalence only holds when max_features prunes nothing
+        assert len(vectorizer.vocabulary_) < 5000
+
+        assert X_train.shape == ref_train.shape
+        assert X_test.shape == ref_test.shape
+        assert np.abs(X_train - ref_train).max() < 1e-12
+        assert np.abs(X_test - ref_test).max() < 1e-12
+
+def test_prefix_of_mixed_tokens():
+    texts = ["Hello, world! it's a well-known fact", "x y zz 123 café naïve", "   ", "one"]
+    split = {'X_train': texts, 'X_test': ["world fact unknown", ""]}
+    pipeline = MLPipeline.__new__(MLPipeline)
+    featurizer = PrefixFeaturizer()
+    train_tokens = featurizer.fit_tokenize(split['X_train'])
+    test_tokens = featurizer.tokenize(split['X_test'])
+
+    for n_tokens in [None, 0, 1, 2, 3]:
+        X_train, X_test = featurizer.vectorize(train_tokens, test_tokens, n_tokens)
+        ref_train, ref_test, _ = reference_matrices(pipeline, split, n_tokens)
+        assert np.abs(X_train - ref_train).max() < 1e-12
+        assert np.abs(X_test - ref_test).max() < 1e-12
+
+def test_negative_prefix_is_rejected():
+    featurizer = PrefixFeaturizer()
+    train_tokens = featurizer.fit_tokenize(["alpha beta", "gamma delta"])
+    test_tokens = featurizer.tokenize(["alpha"])
+    with pytest.raises(ValueError):
+        featurizer.vectorize(train_tokens, test_tokens, -1)
+
+def test_term_index_lookup():
+    shared = 'x' * 20
+    terms = sorted(['apple', 'banana', 'café', shared + 'a', shared + 'b', shared, 'zz' * 40])
+    index = TermIndex(terms)
+
+    assert len(index) == len(terms)
+    assert [index[i] for i in range(len(index))] == terms
+    queries = terms + ['aardvark', 'cafe', shared + 'c', 'x' * 19, 'zzz']
+    expected = list(range(len(terms))) + [-1] * 5
+    assert index.lookup(queries).tolist() == expected
+
+def test_long_token_does_not_pad_vocabulary():
+    texts = [' '.join(f'w{i:05d}x' for i in range(start, start + 100)) for start in range(0, 5000, 100)]
+    long_token = 'a' * 5000
+    texts.append(long_token)
+
+    featurizer = PrefixFeaturizer(max_features=None)
+    train_tokens = featurizer.fit_tokenize(texts)
+    test_tokens = featurizer.tokenize([long_token + ' w00001x'])
+
+    # A fixed-width array would pad every term to 5000 bytes (about 25 MB here)
+    assert featurizer.vocabulary.nbytes < 200_000
+    X_train, X_test = featurizer.vectorize(train_tokens, test_tokens)
+    vectorizer = TfidfVectorizer(stop_words='english')
+    assert np.abs(X_train - vectorizer.fit_transform(texts)).max() < 1e-12
+    assert np.abs(X_test - vectorizer.transform([long_token + ' w00001x'])).max() < 1e-12
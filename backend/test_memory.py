@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from memory import MB, MatrixCache, MemoryTracker, matrix_nbytes
+from ml_pipeline import MLPipeline
+
+def random_pair(seed, rows=200, cols=500):
+    rng = np.random.default_rng(seed)
+    return (
+        sp.random(rows, cols, density=0.05, format='csr', random_state=rng),
+        sp.random(rows // 4, cols, density=0.05, format='csr', random_state=rng)
+    )
+
+def test_cache_spills_to_stay_within_budget(tmp_path):
+    pairs = [random_pair(seed) for seed in range(4)]
+    pair_mb = sum(matrix_nbytes(matrix) for matrix in pairs[0]) / MB
+    tracker = MemoryTracker(cache_budget_mb=pair_mb * 1.5)
+    cache = MatrixCache(tracker, spill_dir=str(tmp_path))
+
+    for key, pair in enumerate(pairs):
+        cache.put(key, pair)
+        assert cache.resident_bytes() <= tracker.cache_budget_mb * MB
+
+    report = tracker.report()['matrix_cache']
+    assert report['spilled_pairs'] == 3
+    assert report['peak_mb'] <= tracker.cache_budget_mb
+    for key, pair in enumerate(pairs):
+        for cached, original in zip(cache.get(key), pair):
+            assert (cached != original).nnz == 0
+
+    spill_dir = cache._directory
+    cache.release(0)
+    assert len(os.listdir(spill_dir)) == 2
+    cache.close()
+    assert not os.path.exists(spill_dir)
+
+def test_cache_without_budget_keeps_everything(tmp_path):
+    tracker = MemoryTracker()
+    cache = MatrixCache(tracker, spill_dir=str(tmp_path))
+    for key in range(3):
+        cache.put(key, random_pair(key))
+    assert tracker.spilled_pairs == 0
+    assert os.listdir(tmp_path) == []
+
+@pytest.fixture(scope='module')
+def pipeline():
+    pipeline = MLPipeline()
+    # The bundled data is regenerated randomly on every load; pin one draw
+    datasets = {}
+    load_dataset = pipeline.data_loader.load_dataset
+    pipeline.data_loader.load_dataset = lambda dataset_id: datasets.setdefault(
+        dataset_id, load_dataset(dataset_id)
+    )
+    return pipeline
+
+def run_batch(pipeline):
+    results = list(pipeline.run_experiment_batch(['news'], ['logistic', 'naive_bayes'], [5, 20]))
+    accuracies = [
+        (result['model'], result['prefix_length'], result['full_text']['accuracy'], result['prefix']['accuracy'])
+        for result in results
+    ]
+    return accuracies, results[-1]['memory']
+
+def test_spilling_does_not_change_results(pipeline):
+    pipeline.matrix_cache_mb = None
+    expected, memory = run_batch(pipeline)
+    assert memory['matrix_cache']['spilled_pairs'] == 0
+
+    pipeline.matrix_cache_mb = 0.01
+    accuracies, memory = run_batch(pipeline)
+    assert memory['matrix_cache']['spilled_pairs'] > 0
+    assert memory['matrix_cache']['peak_mb'] <= 0.01
+    assert accuracies == expected
@@ -0,0 +1,43 @@
+from collections import Counter
+
+import pytest
+
+from ml_pipeline import MLPipeline
+
+@pytest.fixture(scope='module')
+def pipeline():
+    return MLPipeline()
+
+def test_plan_shares_stages(pipeline):
+    stages = pipeline.plan_experiment_batch(
+        ['imdb', 'news', 'imdb'], ['logistic', 'svm', 'logistic'], [10, 50, 10]
+    )
+    counts = Counter(stage['stage'] for stage in stages)
+
+    assert counts['load'] == 2
+    assert counts['tokenize'] == 2
+    # Full text plus each distinct prefix length, per dataset
+    assert counts['vectorize'] == 2 * 3
+    assert counts['baseline'] == 2 * 2
+    assert counts['cell'] == 2 * 2 * 2
+
+    vectorized = [(stage['dataset'], stage['prefix_length'])
+                  for stage in stages if stage['stage'] == 'vectorize']
+    assert len(vectorized) == len(set(vectorized))
+    baselines = [(stage['dataset'], stage['model'])
+                 for stage in stages if stage['stage'] == 'baseline']
+    assert len(baselines) == len(set(baselines))
+
+def test_plan_is_in_dependency_order(pipeline):
+    stages = pipeline.plan_experiment_batch(['imdb', 'news'], ['logistic'], [5, 20])
+    seen = set()
+    for stage in stages:
+        assert all(dep in seen for dep in stage['deps'])
+        if stage['key'] is not None:
+            seen.add(stage['key'])
+
+def test_plan_rejects_bare_strings(pipeline):
+    with pytest.raises(ValueError):
+        pipeline.plan_experiment_batch('imdb', ['logistic'], [10])
+    with pytest.raises(ValueError):
+        pipeline.plan_experiment_batch(['imdb'], ['logistic'], '50')
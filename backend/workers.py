@@ -0,0 +1,68 @@
+"""Training jobs executed inside the ASGI server's process pool.
+
+Only ml_pipeline is imported here so spawned workers stay free of the Flask
+app, the logger and its Supabase client. Streaming jobs push (event, payload)
+pairs onto a manager queue and finish with None.
+"""
+from ml_pipeline import MLPipeline
+
+_pipeline = None
+
+def init_worker():
+    """Build the worker's pipeline up front so the first job does not pay for it"""
+    global _pipeline
+    # Pool workers run one job at a time, so memory can be measured per stage
+    _pipeline = MLPipeline(exclusive=True)
+
+def get_pipeline():
+    if _pipeline is None:
+        init_worker()
+    return _pipeline
+
+def run_experiment(dataset_id, model_id, prefix_length):
+    return get_pipeline().run_experiment(
+        dataset_id=dataset_id,
+        model_id=model_id,
+        prefix_length=prefix_length
+    )
+
+def compare_token_counts(dataset_id, model_id):
+    return get_pipeline().compare_token_counts(
+        dataset_id=dataset_id,
+        model_id=model_id
+    )
+
+def stream_token_counts(queue, dataset_id, model_id):
+    """Push one progress event per token count, then a summary with the raw plot bytes"""
+    pipeline = get_pipeline()
+    try:
+        token_counts = []
+        accuracies = []
+        memory = pipeline.track_memory()
+        for step in pipeline.iter_token_counts(dataset_id, model_id, memory):
+            token_counts.append(step['token_count'])
+            accuracies.append(step['accuracy'])
+            queue.put(('progress', step))
+
+        with memory.stage('plots'):
+            plot = pipeline.create_token_count_plot(accuracies)
+        queue.put(('summary', {
+            'token_counts': token_counts,
+            'accuracies': accuracies,
+            'plot': plot,
+            'memory': memory.report()
+        }))
+    except Exception as e:
+        queue.put(('error', {'error': str(e), 'exception_type': type(e).__name__}))
+    finally:
+        queue.put(None)
+
+def stream_experiment_batch(queue, dataset_ids, model_ids, prefix_lengths):
+    """Push one result event per finished grid cell"""
+    try:
+        for results in get_pipeline().run_experiment_batch(dataset_ids, model_ids, prefix_lengths):
+            queue.put(('result', results))
+    except Exception as e:
+        queue.put(('error', {'error': str(e), 'exception_type': type(e).__name__}))
+    finally:
+        queue.put(None)
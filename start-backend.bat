@@ -19,11 +19,20 @@ pip install -r requirements.txt
 
 echo.
 echo ==========================================
-echo Starting Flask backend on port 5000...
+if "%1"=="--prod" (
+    echo Starting ASGI backend on port 5000...
+) else (
+    echo Starting Flask backend on port 5000...
+)
 echo ==========================================
 echo.
 echo Backend logs will be saved to backend.log
 echo Press Ctrl+C to stop the server
 echo.
 
-python app.py
+if "%1"=="--prod" (
+    rem Training runs in a process pool sized by ML_WORKERS / ML_QUEUE_DEPTH
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+) else (
+    python app.py
+)
@@ -20,11 +20,20 @@ pip install -r requirements.txt
 
 echo ""
 echo "=========================================="
-echo "Starting Flask backend on port 5000..."
+if [ "$1" = "--prod" ]; then
+    echo "Starting ASGI backend on port 5000..."
+else
+    echo "Starting Flask backend on port 5000..."
+fi
 echo "=========================================="
 echo ""
 echo "Backend logs will be saved to backend.log"
 echo "Press Ctrl+C to stop the server"
 echo ""
 
-python app.py
+if [ "$1" = "--prod" ]; then
+    # Training runs in a process pool sized by ML_WORKERS / ML_QUEUE_DEPTH
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+else
+    python app.py
+fi
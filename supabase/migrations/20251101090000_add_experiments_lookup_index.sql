@@ -0,0 +1,14 @@
+/*
+  # Add experiments lookup index
+
+  ## Overview
+  History queries filter experiments by dataset, model and prefix length and
+  return the newest runs first. This composite index serves those lookups
+  without scanning the whole table.
+
+  ## Indexes
+  - `idx_experiments_lookup` on (dataset_id, model_id, prefix_length, created_at DESC)
+*/
+
+CREATE INDEX IF NOT EXISTS idx_experiments_lookup
+  ON experiments(dataset_id, model_id, prefix_length, created_at DESC);
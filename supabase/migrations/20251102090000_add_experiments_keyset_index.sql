@@ -0,0 +1,14 @@
+/*
+  # Add experiments keyset pagination index
+
+  ## Overview
+  The history API pages through experiments newest first using the
+  (created_at, id) pair as a cursor. This index lets each page start at the
+  cursor position instead of skipping over earlier rows.
+
+  ## Indexes
+  - `idx_experiments_keyset` on (created_at DESC, id DESC)
+*/
+
+CREATE INDEX IF NOT EXISTS idx_experiments_keyset
+  ON experiments(created_at DESC, id DESC);
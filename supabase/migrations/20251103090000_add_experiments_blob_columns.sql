@@ -0,0 +1,18 @@
+/*
+  # Add compressed blob columns to experiments
+
+  ## Overview
+  Per-sample `predictions`/`true_labels` arrays and base64 plot images made
+  up most of each experiment row. The backend now strips the arrays from the
+  metrics jsonb and writes them, and the plots, as zlib-compressed binary
+  blobs (the same format as the local SQLite store). Rows written before this
+  migration keep their arrays inline and their plots in the `plots` jsonb
+  column; the backend reads both layouts.
+
+  ## Columns
+  - `arrays` (bytea) - Compressed per-sample predictions and true labels
+  - `plots_blob` (bytea) - Compressed raw PNG plot images
+*/
+
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS arrays bytea;
+ALTER TABLE experiments ADD COLUMN IF NOT EXISTS plots_blob bytea;
@@ -0,0 +1,73 @@
+/*
+  # Add experiment aggregation function
+
+  ## Overview
+  `/api/experiments/summary` reports count, mean, min and max of one metric
+  per group of experiments. Grouping in the database returns one row per
+  group in a single call instead of paging every matching experiment through
+  PostgREST.
+
+  ## Functions
+  - `aggregate_experiments(metric, group_by, dataset_id, model_id, prefix_length, since, until)`
+    - `metric`: performance_retention, full_accuracy or prefix_accuracy
+    - `group_by`: any of dataset_id, model_id, prefix_length; columns not
+      grouped on are returned as NULL
+    - Remaining arguments are optional filters (`until` is exclusive)
+
+  ## Security
+  - Runs with the caller's privileges, so the experiments RLS policies apply
+  - Executable by anon (demo purposes)
+*/
+
+CREATE OR REPLACE FUNCTION aggregate_experiments(
+  metric text,
+  group_by text[],
+  filter_dataset_id text DEFAULT NULL,
+  filter_model_id text DEFAULT NULL,
+  filter_prefix_length integer DEFAULT NULL,
+  since timestamptz DEFAULT NULL,
+  until timestamptz DEFAULT NULL
+)
+RETURNS TABLE (
+  dataset_id text,
+  model_id text,
+  prefix_length integer,
+  count bigint,
+  mean double precision,
+  min double precision,
+  max double precision
+)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT
+    CASE WHEN 'dataset_id' = ANY(group_by) THEN e.dataset_id END,
+    CASE WHEN 'model_id' = ANY(group_by) THEN e.model_id END,
+    CASE WHEN 'prefix_length' = ANY(group_by) THEN e.prefix_length END,
+    count(e.value),
+    avg(e.value),
+    min(e.value),
+    max(e.value)
+  FROM (
+    SELECT
+      experiments.dataset_id,
+      experiments.model_id,
+      experiments.prefix_length,
+      CASE metric
+        WHEN 'performance_retention' THEN experiments.performance_retention::double precision
+        WHEN 'full_accuracy' THEN (experiments.full_text_metrics->>'accuracy')::double precision
+        WHEN 'prefix_accuracy' THEN (experiments.prefix_metrics->>'accuracy')::double precision
+      END AS value
+    FROM experiments
+    WHERE (filter_dataset_id IS NULL OR experiments.dataset_id = filter_dataset_id)
+      AND (filter_model_id IS NULL OR experiments.model_id = filter_model_id)
+      AND (filter_prefix_length IS NULL OR experiments.prefix_length = filter_prefix_length)
+      AND (since IS NULL OR experiments.created_at >= since)
+      AND (until IS NULL OR experiments.created_at < until)
+  ) e
+  GROUP BY 1, 2, 3
+  HAVING count(e.value) > 0
+  ORDER BY 1, 2, 3;
+$$;
+
+GRANT EXECUTE ON FUNCTION aggregate_experiments(text, text[], text, text, integer, timestamptz, timestamptz) TO anon;